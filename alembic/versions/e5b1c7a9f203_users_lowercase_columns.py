@@ -0,0 +1,63 @@
+"""users lowercase columns
+
+Revision ID: e5b1c7a9f203
+Revises: d47e91c3a5b8
+Create Date: 2026-10-19 18:40:12.305117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1c7a9f203'
+down_revision = 'd47e91c3a5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_name_lower')
+        batch_op.drop_index('ix_users_email_lower')
+        batch_op.add_column(sa.Column('email_lower', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('name_lower', sa.Text(), nullable=True))
+
+    # Lowercased in Python: SQLite's lower() only folds ASCII
+    conn = op.get_bind()
+    users = sa.table(
+        'users',
+        sa.column('id', sa.Integer),
+        sa.column('email', sa.Text),
+        sa.column('name', sa.Text),
+        sa.column('email_lower', sa.Text),
+        sa.column('name_lower', sa.Text),
+    )
+    rows = conn.execute(sa.select(users.c.id, users.c.email, users.c.name)).all()
+    if rows:
+        conn.execute(
+            users.update()
+            .where(users.c.id == sa.bindparam('user_id'))
+            .values(email_lower=sa.bindparam('email_lower'), name_lower=sa.bindparam('name_lower')),
+            [
+                {'user_id': id, 'email_lower': email.lower(), 'name_lower': name.lower()}
+                for id, email, name in rows
+            ],
+        )
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('email_lower', existing_type=sa.Text(), nullable=False)
+        batch_op.alter_column('name_lower', existing_type=sa.Text(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_users_email_lower'), ['email_lower'], unique=False)
+        batch_op.create_index(batch_op.f('ix_users_name_lower'), ['name_lower'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_name_lower'))
+        batch_op.drop_index(batch_op.f('ix_users_email_lower'))
+        batch_op.drop_column('name_lower')
+        batch_op.drop_column('email_lower')
+    # Outside the batch: a recreated SQLite table can't carry expression indexes
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=False)
+    op.create_index('ix_users_name_lower', 'users', [sa.text('lower(name)')], unique=False)
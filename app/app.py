@@ -1,31 +1,41 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 import os
 from app.routers import users, auth, orders, products
+from app.utils import HashPoolSaturated, hash_pool
+from app.deps import principal_cache, user_cache, user_name_cache
+from app.metrics import MetricsMiddleware, registry
+from app.loop_monitor import loop_monitor
+from app.capture import CAPTURE_ENABLED, CaptureMiddleware
+from app.ws import ws_connections
+from app.outbox import outbox
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    ws_connections.start()
+    outbox.start()
+    yield
+    await outbox.stop()
+    await ws_connections.stop()
+    await loop_monitor.stop()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Canteen Backend")
+    app = FastAPI(
+        title="Canteen Backend",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan,
+    )
 
     # -------------------------
-    # 🔥 Request Body Logger
+    # 🔥 Request capture (CAPTURE_ENABLED=true), replay with benchmarks/replay.py
     # -------------------------
-    # @app.middleware("http")
-    # async def log_request(request: Request, call_next):
-    #     body = await request.body()
-    #     print("\n=== REQUEST BODY START ===")
-    #     print(body.decode() or "<empty>")
-    #     print("=== REQUEST BODY END ===\n")
-
-    #     # Re-inject the body so downstream code can read it again
-    #     async def receive():
-    #         return {"type": "http.request", "body": body}
-
-    #     request = Request(request.scope, receive=receive)
-
-    #     response = await call_next(request)
-    #     return response
+    if CAPTURE_ENABLED:
+        app.add_middleware(CaptureMiddleware)
 
     # Serve static files
     from fastapi.staticfiles import StaticFiles
@@ -46,6 +56,8 @@ def create_app() -> FastAPI:
         "http://127.0.0.1"
     ]
 
+    app.add_middleware(MetricsMiddleware)
+
     # CORS middleware
     app.add_middleware(
         CORSMiddleware,
@@ -56,8 +68,65 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    @app.exception_handler(HashPoolSaturated)
+    async def hash_pool_saturated(request: Request, exc: HashPoolSaturated):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is busy, please retry"},
+            headers={"Retry-After": "1"},
+        )
+
     @app.get("/health")
     async def health() -> str:
         return "ok"
 
+    @app.get("/health/hash-pool")
+    async def hash_pool_health() -> dict:
+        return hash_pool.stats()
+
+    @app.get("/health/auth-cache")
+    async def auth_cache_health() -> dict:
+        return {
+            "principals": principal_cache.stats(),
+            "users": user_cache.stats(),
+            "user_names": user_name_cache.stats(),
+        }
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics() -> str:
+        return registry.render()
+
     return app
+
+
+# Live values, read at scrape time
+registry.gauge(
+    "ws_order_connections",
+    "Sockets connected to /order/ws",
+    lambda: len(orders.order_subscribers),
+)
+registry.gauge(
+    "ws_user_connections",
+    "Sockets connected to /order/ws/updates/{user_id}",
+    lambda: sum(len(s) for s in orders.user_connections.values()),
+)
+registry.gauge(
+    "ws_connected_users",
+    "Distinct users with an open updates socket",
+    lambda: len(orders.user_connections),
+)
+registry.gauge(
+    "hash_pool_queue_depth",
+    "bcrypt jobs waiting for a worker",
+    lambda: hash_pool.queue_depth,
+)
+registry.gauge(
+    "hash_pool_in_flight",
+    "bcrypt jobs running or waiting",
+    lambda: hash_pool.in_flight,
+)
+registry.gauge(
+    "hash_pool_rejected",
+    "bcrypt jobs rejected because the queue was full",
+    lambda: hash_pool.rejected,
+)
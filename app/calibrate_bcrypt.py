@@ -0,0 +1,54 @@
+"""
+Pick a bcrypt cost factor for this machine.
+
+    python -m app.calibrate_bcrypt --target-ms 250
+
+Times a verify at each cost and prints the highest cost whose median
+verify time stays under the target. Put the result in BCRYPT_ROUNDS; existing
+hashes are upgraded (or downgraded) transparently on each user's next login.
+"""
+import argparse
+import statistics
+import time
+
+import bcrypt
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 16
+
+
+def time_verify(rounds: int, samples: int) -> float:
+    """Median verify time in milliseconds for the given cost."""
+    password = b"calibration-password"
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        bcrypt.checkpw(password, hashed)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float, samples: int) -> int:
+    chosen = MIN_ROUNDS
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        elapsed = time_verify(rounds, samples)
+        print(f"rounds={rounds:<3} verify={elapsed:8.1f} ms")
+        if elapsed > target_ms:
+            break
+        chosen = rounds
+    return chosen
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    rounds = calibrate(args.target_ms, args.samples)
+    print(f"\nBCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Sampled request capture to rotating JSONL files, for benchmarks/replay.py.
+
+Off unless CAPTURE_ENABLED=true. Each captured request is one JSON line:
+ts, method, path, route, query, headers (CAPTURE_HEADERS only), body,
+status and duration_ms. Only bodies that can be redacted are kept: JSON,
+form-encoded and CSV, with fields (or CSV columns) named in
+CAPTURE_REDACT_FIELDS masked. Any other body, or one cut off at
+CAPTURE_MAX_BODY, is dropped. Files are written by a background thread
+through a RotatingFileHandler, so the request path only serialises and
+enqueues.
+"""
+import csv
+import io
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from os import getenv
+from time import perf_counter, time
+from urllib.parse import parse_qsl
+
+import orjson
+
+CAPTURE_ENABLED = getenv("CAPTURE_ENABLED", "false").lower() == "true"
+CAPTURE_SAMPLE_RATE = float(getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+CAPTURE_DIR = getenv("CAPTURE_DIR", "./captures")
+CAPTURE_MAX_BYTES = int(getenv("CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+CAPTURE_MAX_FILES = int(getenv("CAPTURE_MAX_FILES", "10"))
+CAPTURE_MAX_BODY = int(getenv("CAPTURE_MAX_BODY", str(64 * 1024)))
+CAPTURE_HEADERS = {
+    h.strip().lower().encode()
+    for h in getenv("CAPTURE_HEADERS", "content-type,accept,user-agent").split(",")
+    if h.strip()
+}
+CAPTURE_REDACT_FIELDS = {
+    f.strip() for f in getenv("CAPTURE_REDACT_FIELDS", "password,refresh_token").split(",") if f.strip()
+}
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {
+            k: "***" if k in CAPTURE_REDACT_FIELDS else _redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+def _redact_csv(text: str) -> str:
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return ""
+    masked = [i for i, name in enumerate(rows[0]) if name.strip() in CAPTURE_REDACT_FIELDS]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(rows[0])
+    for row in rows[1:]:
+        writer.writerow(["***" if i in masked else v for i, v in enumerate(row)])
+    return out.getvalue()
+
+
+def _encode_body(body: bytes, content_type: str, truncated: bool) -> dict:
+    """The body in a form that can't leak a secret; {} if there is none."""
+    if not body or truncated:
+        return {}
+    try:
+        if "json" in content_type:
+            return {"json": _redact(orjson.loads(body))}
+        if "x-www-form-urlencoded" in content_type:
+            fields = parse_qsl(body.decode("utf-8"), keep_blank_values=True)
+            return {"form": [[k, "***" if k in CAPTURE_REDACT_FIELDS else v] for k, v in fields]}
+        if "csv" in content_type:
+            return {"body": _redact_csv(body.decode("utf-8-sig"))}
+    except (ValueError, csv.Error):
+        # orjson.JSONDecodeError and UnicodeDecodeError are ValueErrors
+        pass
+    return {}
+
+
+_writers: dict[str, logging.Logger] = {}
+
+
+def _build_writer(directory: str) -> logging.Logger:
+    """One writer thread per capture directory, shared by every app instance."""
+    if directory in _writers:
+        return _writers[directory]
+
+    os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(
+        os.path.join(directory, "requests.jsonl"),
+        maxBytes=CAPTURE_MAX_BYTES,
+        backupCount=CAPTURE_MAX_FILES,
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records: queue.Queue = queue.Queue(-1)
+    QueueListener(records, handler).start()
+
+    writer = logging.getLogger(f"app.capture.{len(_writers)}")
+    writer.setLevel(logging.INFO)
+    writer.propagate = False
+    writer.addHandler(QueueHandler(records))
+    _writers[directory] = writer
+    return writer
+
+
+class CaptureMiddleware:
+    """Pure ASGI; the body is copied as the app reads it, never re-injected."""
+
+    def __init__(
+        self,
+        app,
+        directory: str = CAPTURE_DIR,
+        sample_rate: float = CAPTURE_SAMPLE_RATE,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.writer = _build_writer(directory)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        chunks: list[bytes] = []
+        size = 0
+        status_code = 500
+
+        async def receive_wrapper():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                if size < CAPTURE_MAX_BODY:
+                    chunks.append(chunk[: CAPTURE_MAX_BODY - size])
+                size += len(chunk)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        ts = time()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration = perf_counter() - start
+            headers = {
+                k.decode(): v.decode("latin-1")
+                for k, v in scope["headers"]
+                if k in CAPTURE_HEADERS
+            }
+            route = scope.get("route")
+            record = {
+                "ts": ts,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route.path if route is not None else None,
+                "query": scope["query_string"].decode("latin-1"),
+                "headers": headers,
+                "status": status_code,
+                "duration_ms": round(duration * 1000, 3),
+                "truncated": size > CAPTURE_MAX_BODY,
+                **_encode_body(
+                    b"".join(chunks),
+                    headers.get("content-type", ""),
+                    size > CAPTURE_MAX_BODY,
+                ),
+            }
+            self.writer.info(orjson.dumps(record).decode())
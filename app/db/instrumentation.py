@@ -0,0 +1,111 @@
+"""
+Per-request SQL accounting through SQLAlchemy engine events.
+
+Every statement on any engine is timed. Inside an HTTP request (see
+app.metrics.MetricsMiddleware) the count and total time are added to the
+request's RequestStats. Statements slower than SQL_SLOW_QUERY_MS are logged
+with their parameters and, with SQL_EXPLAIN_SLOW, the database's plan.
+"""
+import logging
+from contextvars import ContextVar
+from os import getenv
+from time import perf_counter
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("app.sql")
+
+SQL_SLOW_QUERY_MS = float(getenv("SQL_SLOW_QUERY_MS", "200"))
+SQL_EXPLAIN_SLOW = getenv("SQL_EXPLAIN_SLOW", "false").lower() == "true"
+# Adds X-DB-Query-Count / X-DB-Time-Ms to every response; for development
+SQL_DEBUG_HEADERS = getenv("SQL_DEBUG_HEADERS", "false").lower() == "true"
+# BEGIN/SAVEPOINT etc. aren't counted against a request; they're not queries
+# and appear or not depending on how the session is bound (e.g. in tests).
+TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+# Same statement this many times in one request is reported as a likely N+1
+SQL_REPEAT_WARNING = int(getenv("SQL_REPEAT_WARNING", "5"))
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        # statement text -> times executed
+        self.statements: dict[str, int] = {}
+
+    def repeated(self, threshold: int = SQL_REPEAT_WARNING) -> dict[str, int]:
+        return {sql: n for sql, n in self.statements.items() if n >= threshold}
+
+
+# Set for the duration of each HTTP request by MetricsMiddleware
+current_request: ContextVar[RequestStats | None] = ContextVar(
+    "current_request", default=None
+)
+
+# Called as listener(method, route_path, endpoint, stats) after each request;
+# the pytest query budget plugin hooks in here.
+request_listeners: list[Callable] = []
+
+
+def _explain(conn, statement: str, parameters) -> list:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["query_start"].pop()
+
+    stats = current_request.get()
+    if stats is not None and not statement.startswith(TRANSACTION_CONTROL):
+        stats.queries += 1
+        stats.db_time += elapsed
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+    if elapsed * 1000 < SQL_SLOW_QUERY_MS:
+        return
+
+    logger.warning(
+        "slow query %.1f ms: %s params=%r", elapsed * 1000, statement, parameters
+    )
+    if SQL_EXPLAIN_SLOW and not executemany and statement.lstrip().upper().startswith("SELECT"):
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as e:
+            logger.warning("EXPLAIN failed: %s", e)
+        else:
+            logger.warning("plan: %s", plan)
+
+
+def finish_request(method: str, path: str, endpoint, stats: RequestStats) -> None:
+    for sql, times in stats.repeated().items():
+        logger.warning("%s %s ran the same statement %d times: %s", method, path, times, sql)
+    for listener in request_listeners:
+        listener(method, path, endpoint, stats)
+
+
+def query_budget(limit: int):
+    """Declare the most SQL statements one call of an endpoint may run.
+
+    Checked by the pytest query budget plugin (tests/query_budget.py).
+    """
+
+    def decorate(fn):
+        fn.query_budget = limit
+        return fn
+
+    return decorate
@@ -1,11 +1,16 @@
 import sqlalchemy as sa
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.dialects.sqlite import JSON
 from sqlalchemy.sql.schema import ForeignKey
 from .sessions import Base
 from uuid import uuid4
+from datetime import datetime
 from sqlalchemy import Enum
 
+def _lowered(column: str):
+    return lambda context: context.get_current_parameters()[column].lower()
+
+
 class Order(Base):
     __tablename__ = "orders"
     id = sa.Column(sa.Integer, primary_key=True, index=True)
@@ -40,6 +45,17 @@ class Users(Base):
     name = sa.Column(sa.Text, nullable=False)
     creation_date = sa.Column(sa.DateTime, server_default=sa.func.now(), nullable=False)
 
+    # Lowercased by Python for /users/search range scans: SQLite's lower()
+    # only folds ASCII, so Cyrillic names wouldn't match case-insensitively.
+    # Filled on insert (ORM or Core) and on ORM attribute changes.
+    email_lower = sa.Column(sa.Text, nullable=False, index=True, default=_lowered("email"))
+    name_lower = sa.Column(sa.Text, nullable=False, index=True, default=_lowered("name"))
+
+    @validates("email", "name")
+    def _lower(self, key, value):
+        setattr(self, f"{key}_lower", value.lower() if value is not None else None)
+        return value
+
 class Products(Base):
     __tablename__ = "products"
 
@@ -49,4 +65,26 @@ class Products(Base):
     quantity = sa.Column(sa.Integer, nullable = False)
     reg_time = sa.Column(sa.DateTime, server_default=sa.func.now(), nullable=False)
     prod_type = sa.Column(sa.Text, nullable=False) 
-    image_path = sa.Column(sa.Text, nullable=True)
\ No newline at end of file
+    image_path = sa.Column(sa.Text, nullable=True)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = sa.Column(sa.Text, primary_key=True)
+    expires_at = sa.Column(sa.DateTime, nullable=False, index=True)
+
+
+class OutboxEvent(Base):
+    """Side effects of a write, committed with it; drained by app.outbox."""
+    __tablename__ = "outbox"
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    topic = sa.Column(sa.Text, nullable=False)
+    payload = sa.Column(sa.JSON, nullable=False)
+    created_at = sa.Column(sa.DateTime, server_default=sa.func.now(), nullable=False)
+    available_at = sa.Column(sa.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    attempts = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+    last_error = sa.Column(sa.Text, nullable=True)
+    # Set once attempts run out; the row is kept for inspection
+    dead_at = sa.Column(sa.DateTime, nullable=True)
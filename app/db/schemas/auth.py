@@ -1,10 +1,15 @@
 from pydantic import BaseModel
+from typing import List, Literal
 
 class LoginRequest(BaseModel):
     email: str
     password: str
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str
@@ -21,3 +26,18 @@ class TokenData(BaseModel):
 class TokenPayload(BaseModel):
     sub: str | None = None
     exp: float | None = None
+    jti: str | None = None
+    # "access" or "refresh"; the two secrets may be the same
+    type: str | None = None
+
+
+class BulkRegisterRow(BaseModel):
+    row: int
+    email: str | None = None
+    status: Literal["created", "exists", "duplicate", "invalid"]
+    detail: str | None = None
+
+
+class BulkRegisterResult(BaseModel):
+    created: int
+    results: List[BulkRegisterRow]
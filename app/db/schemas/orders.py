@@ -28,4 +28,11 @@ class OrderSend(BaseModel):
 
 
 class OrderUpdate(BaseModel):
-    status: Literal["cancelled", "pending", "ready", "paid"] = "pending"
\ No newline at end of file
+    status: Literal["cancelled", "pending", "ready", "paid"] = "pending"
+
+class OrderFilters(BaseModel):
+    """/order/ws subscription; each list is OR-ed, the lists are AND-ed."""
+    order_id: List[int] | None = None
+    code: List[str] | None = None
+    prod_type: List[str] | None = None
+    status: List[Literal["cancelled", "pending", "ready", "paid"]] | None = None
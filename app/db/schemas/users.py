@@ -1,4 +1,4 @@
-from pydantic import BaseModel, constr, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, constr, EmailStr, Field
 from datetime import date
 from typing import Optional
 
@@ -7,16 +7,15 @@ from typing import Optional
 class UsersBase(BaseModel):
     email: EmailStr
     name: str
-    class Config:
-        orm_mode = True
+
+    model_config = ConfigDict(from_attributes=True)
 
 class UserUpdate(BaseModel):
     email: Optional[EmailStr] = None
     name: Optional[str] = None
     password: Optional[str] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UsersCreate(UsersBase):
     password: str = Field(alias="password")
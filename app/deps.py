@@ -1,7 +1,9 @@
 from datetime import datetime
-from fastapi import Depends, HTTPException, status
+from os import getenv
+from fastapi import Depends, HTTPException, Request, WebSocket, status
 from fastapi.security import OAuth2PasswordBearer
 from .utils import ALGORITHM, JWT_SECRET_KEY
+from .cache import TTLCache
 
 from jose import jwt
 from jose.exceptions import JWTError
@@ -14,17 +16,42 @@ from app.db import sessions
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
 )
+from typing import Any, AsyncGenerator
     
 reuseable_oauth = OAuth2PasswordBearer(tokenUrl="/auth/login", scheme_name="JWT")
+optional_oauth = OAuth2PasswordBearer(tokenUrl="/auth/login", scheme_name="JWT", auto_error=False)
 
+# token -> email, entries never outlive the token's own `exp`
+principal_cache = TTLCache(
+    maxsize=int(getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(getenv("PRINCIPAL_CACHE_TTL", "900")),
+)
+# email -> detached Users row, invalidated by edit_user / delete_user.
+# Other workers only see an edit once their entry expires, so keep the TTL short.
+user_cache = TTLCache(
+    maxsize=int(getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(getenv("USER_CACHE_TTL", "60")),
+)
 
-async def get_current_user(
-    token: str = Depends(reuseable_oauth),
-    db: AsyncSession = Depends(sessions.get_async_session),
-) -> user_schemas.Users:
+# user id -> display name for /users/names
+user_name_cache = TTLCache(
+    maxsize=int(getenv("USER_NAME_CACHE_SIZE", "20000")),
+    ttl=float(getenv("USER_NAME_CACHE_TTL", "300")),
+)
+
+
+def invalidate_user(email: str, user_id: int | None = None) -> None:
+    user_cache.pop(email)
+    if user_id is not None:
+        user_name_cache.pop(user_id)
+
+
+def _decode_token(token: str) -> str:
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
         token_data = auth_schemas.TokenPayload(**payload)
+        if token_data.type != "access":
+            raise JWTError("not an access token")
 
         if (
             not token_data.exp
@@ -42,7 +69,58 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    q = await db.scalars(select(Users).filter(Users.email == token_data.sub))
+    principal_cache.set(token, token_data.sub, expires_at=token_data.exp)
+    return token_data.sub
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, Any]:
+    """For handlers that only SELECT; anything they add is never flushed.
+    Routes with a `user_id` path parameter get read-your-writes stickiness."""
+    async with sessions.read_session_for(request.path_params.get("user_id")) as session:
+        yield session
+
+
+def _principal_or_none(token: str | None) -> str | None:
+    if not token:
+        return None
+    email = principal_cache.get(token)
+    if email is None:
+        try:
+            email = _decode_token(token)
+        except HTTPException:
+            return None
+    return email
+
+
+async def get_optional_principal(token: str | None = Depends(optional_oauth)) -> str | None:
+    """Email of a valid bearer token, or None; never rejects the request."""
+    return _principal_or_none(token)
+
+
+def get_websocket_principal(websocket: WebSocket) -> str | None:
+    """Email of a valid access token sent as ?token= (browsers can't set
+    headers on a WebSocket) or as a bearer Authorization header, or None."""
+    token = websocket.query_params.get("token")
+    if token is None:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer":
+            token = credentials
+    return _principal_or_none(token)
+
+
+async def get_current_user(
+    token: str = Depends(reuseable_oauth),
+    db: AsyncSession = Depends(sessions.get_async_session),
+) -> user_schemas.Users:
+    email = principal_cache.get(token)
+    if email is None:
+        email = _decode_token(token)
+
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+
+    q = await db.scalars(select(Users).filter(Users.email == email))
     user = q.first()
 
     if user is None:
@@ -51,4 +129,7 @@ async def get_current_user(
             detail="Could not find user",
         )
 
+    # Detach so the cached row is never flushed through another request's session
+    db.expunge(user)
+    user_cache.set(email, user)
     return user
@@ -0,0 +1,114 @@
+"""
+Event-loop lag monitor and load shedding.
+
+A task on the loop measures how late its own sleeps wake up. A watchdog
+thread notices when that task stops checking in and logs the loop thread's
+stack, which shows the coroutine that is blocking. Routes that opt in with
+Depends(shed_when_lagging) answer 503 + Retry-After while lag is high, so
+order creation and status updates keep the loop to themselves.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import traceback
+from os import getenv
+from time import monotonic
+
+from fastapi import HTTPException, Request, status
+
+from app.metrics import Counter, registry
+
+logger = logging.getLogger("app.loop")
+
+LOOP_LAG_INTERVAL = float(getenv("LOOP_LAG_INTERVAL", "0.05"))
+LOOP_STALL_THRESHOLD = float(getenv("LOOP_STALL_THRESHOLD", "0.25"))
+LOAD_SHED_LAG_MS = float(getenv("LOAD_SHED_LAG_MS", "100"))
+LOAD_SHED_RETRY_AFTER = int(getenv("LOAD_SHED_RETRY_AFTER", "2"))
+
+
+class LoopMonitor:
+    def __init__(self, interval: float, stall_threshold: float):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        # Seconds; jumps up immediately, decays slowly so shedding doesn't flap
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_stall_stack: str | None = None
+        self._heartbeat = monotonic()
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+
+    def _record(self, lag: float) -> None:
+        self.lag = lag if lag > self.lag else self.lag * 0.8 + lag * 0.2
+        self.max_lag = max(self.max_lag, lag)
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, loop.time() - start - self.interval))
+            self._heartbeat = monotonic()
+
+    def _watch(self) -> None:
+        in_stall = False
+        while not self._stop.wait(self.interval):
+            behind = monotonic() - self._heartbeat - self.interval
+            if behind < self.stall_threshold:
+                in_stall = False
+                continue
+            # Let requests that arrive right after the stall see the lag
+            self._record(behind)
+            if in_stall:
+                continue
+            in_stall = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            self.last_stall_stack = "".join(traceback.format_stack(frame)) if frame else None
+            logger.warning(
+                "event loop blocked for %.0f ms, loop thread stack:\n%s",
+                behind * 1000,
+                self.last_stall_stack,
+            )
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+loop_monitor = LoopMonitor(LOOP_LAG_INTERVAL, LOOP_STALL_THRESHOLD)
+
+SHED_TOTAL = registry.register(
+    Counter("http_shed_total", "Requests rejected because the event loop lagged", ("route",))
+)
+registry.gauge("event_loop_lag_seconds", "Smoothed event loop lag", lambda: loop_monitor.lag)
+registry.gauge("event_loop_stalls", "Event loop stalls seen by the watchdog", lambda: loop_monitor.stalls)
+
+
+async def shed_when_lagging(request: Request) -> None:
+    """Dependency for expensive, non-critical routes."""
+    if loop_monitor.lag * 1000 > LOAD_SHED_LAG_MS:
+        SHED_TOTAL.inc(request.scope["route"].path)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry",
+            headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+        )
@@ -0,0 +1,197 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+Everything is kept in plain dicts and only touched from the event loop, so
+recording is a few dict operations per request. Values are per worker
+process; scrape each worker (or sum them) when running several.
+"""
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Iterable
+
+from app.db.instrumentation import (
+    SQL_DEBUG_HEADERS,
+    RequestStats,
+    current_request,
+    finish_request,
+)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            base = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{base} {series[-1]}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from `fn`, so nothing is recorded on the hot path."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.fn()}",
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help, fn))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template",
+        ("method", "route"),
+    )
+)
+REQUESTS_TOTAL = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route template and status",
+        ("method", "route", "status"),
+    )
+)
+DB_QUERIES_PER_REQUEST = registry.register(
+    Histogram(
+        "db_queries_per_request",
+        "SQL statements executed while handling one request",
+        ("route",),
+        buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+    )
+)
+DB_TIME_PER_REQUEST = registry.register(
+    Histogram(
+        "db_time_per_request_seconds",
+        "Time spent in SQL statements while handling one request",
+        ("route",),
+    )
+)
+BROADCAST_DURATION = registry.register(
+    Histogram(
+        "ws_broadcast_duration_seconds",
+        "Time to fan one event out to its WebSocket subscribers",
+        ("kind",),
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    )
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; avoids BaseHTTPMiddleware's extra task per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = RequestStats()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SQL_DEBUG_HEADERS:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-query-count", str(stats.queries).encode()),
+                        (b"x-db-time-ms", f"{stats.db_time * 1000:.2f}".encode()),
+                    ]
+            await send(message)
+
+        token = current_request.set(stats)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start
+            current_request.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else "<unmatched>"
+            method = scope["method"]
+            REQUEST_DURATION.observe(elapsed, method, path)
+            REQUESTS_TOTAL.inc(method, path, status_code)
+            DB_QUERIES_PER_REQUEST.observe(stats.queries, path)
+            DB_TIME_PER_REQUEST.observe(stats.db_time, path)
+            finish_request(method, path, getattr(route, "endpoint", None), stats)
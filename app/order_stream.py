@@ -0,0 +1,151 @@
+"""
+Wire protocol for /order/ws.
+
+Clients pick a version with the WebSocket subprotocol header:
+
+    new WebSocket(url)                          v1, JSON text, full orders
+    new WebSocket(url, ["orders.v2"])           v2, JSON text
+    new WebSocket(url, ["orders.v2.binary"])    v2, same JSON in binary frames
+
+v1 sends the whole order on every event. v2 sends it the first time a socket
+sees an order ({"type": "order_created" | "order_update", "data": {...}})
+and after that only the fields that changed:
+
+    {"type": "order_delta", "id": 12, "data": {"status": "ready"}}
+
+Each event is serialised once per message shape and the same frame is sent
+to every socket that needs it. permessage-deflate is negotiated by uvicorn
+(--ws-per-message-deflate, on by default); benchmarks/order_stream.py
+measures bytes per event with and without it.
+"""
+from fastapi import WebSocket
+import orjson
+
+from app.ws import send_message
+
+PROTOCOL_V2 = "orders.v2"
+PROTOCOL_V2_BINARY = "orders.v2.binary"
+SUBPROTOCOLS = (PROTOCOL_V2_BINARY, PROTOCOL_V2)
+
+# Once an order reaches one of these, clients won't get further deltas for it
+FINAL_STATUSES = frozenset({"paid", "cancelled"})
+# Orders remembered per socket; older ones are sent in full again
+MAX_KNOWN_ORDERS = 1024
+
+
+def order_data(order) -> dict:
+    return {
+        "id": order.id,
+        "user_id": order.user_id,
+        "user_name": order.user_name,
+        "code": order.code,
+        "items": order.items,
+        "price": order.price,
+        "comment": order.comment,
+        "status": order.status,
+        "timestamp": order.timestamp.isoformat(),
+    }
+
+
+def negotiate(websocket: WebSocket) -> str | None:
+    """The subprotocol to accept with, or None for v1."""
+    offered = websocket.scope.get("subprotocols", [])
+    for protocol in SUBPROTOCOLS:
+        if protocol in offered:
+            return protocol
+    return None
+
+
+class OrderEvent:
+    """One order event, encoded lazily and at most once per message shape."""
+
+    __slots__ = ("type", "data", "changed", "_full", "_delta", "_full_text", "_delta_text")
+
+    def __init__(self, type: str, data: dict, changed: tuple[str, ...] | None = None):
+        self.type = type
+        self.data = data
+        # None: everything may have changed, so v2 sends the full order
+        self.changed = changed
+        self._full: bytes | None = None
+        self._delta: bytes | None = None
+        # Decoded once for all text sockets
+        self._full_text: str | None = None
+        self._delta_text: str | None = None
+
+    @property
+    def id(self) -> int:
+        return self.data["id"]
+
+    @property
+    def full(self) -> bytes:
+        if self._full is None:
+            self._full = orjson.dumps({"type": self.type, "data": self.data})
+        return self._full
+
+    @property
+    def delta(self) -> bytes:
+        if self._delta is None:
+            self._delta = orjson.dumps({
+                "type": "order_delta",
+                "id": self.id,
+                "data": {field: self.data[field] for field in self.changed},
+            })
+        return self._delta
+
+    @property
+    def full_text(self) -> str:
+        if self._full_text is None:
+            self._full_text = self.full.decode()
+        return self._full_text
+
+    @property
+    def delta_text(self) -> str:
+        if self._delta_text is None:
+            self._delta_text = self.delta.decode()
+        return self._delta_text
+
+
+class OrderStream:
+    """Per-socket protocol state."""
+
+    __slots__ = ("version", "binary", "known")
+
+    def __init__(self, subprotocol: str | None = None):
+        self.version = 1 if subprotocol is None else 2
+        self.binary = subprotocol == PROTOCOL_V2_BINARY
+        # Order ids this socket has the full object for; insertion ordered
+        self.known: dict[int, None] = {}
+
+    def _use_delta(self, event: OrderEvent) -> bool:
+        """Whether this socket gets the delta; updates what it knows."""
+        if self.version == 1:
+            return False
+
+        order_id = event.id
+        delta = event.changed is not None and order_id in self.known
+        if not delta:
+            self.known[order_id] = None
+            if len(self.known) > MAX_KNOWN_ORDERS:
+                del self.known[next(iter(self.known))]
+        if event.data["status"] in FINAL_STATUSES:
+            self.known.pop(order_id, None)
+        return delta
+
+    def frame(self, event: OrderEvent) -> bytes | str:
+        """The payload this socket gets for `event`: bytes for binary frames,
+        str for text ones. Updates what the socket knows."""
+        delta = self._use_delta(event)
+        if self.binary:
+            return event.delta if delta else event.full
+        return event.delta_text if delta else event.full_text
+
+    async def send(self, websocket: WebSocket, event: OrderEvent) -> None:
+        payload = self.frame(event)
+        if self.binary:
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+
+    async def send_message(self, websocket: WebSocket, message: dict) -> None:
+        """Control messages (pong, errors...) go in the same frame type as events."""
+        await send_message(websocket, message, self.binary)
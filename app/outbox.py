@@ -0,0 +1,186 @@
+"""
+Transactional outbox for post-commit side effects.
+
+A handler adds its side effects with outbox.add(session, topic, payload) in
+the same transaction as the data change, commits, calls outbox.notify() and
+returns. The dispatcher task drains the table in id order, in batches of
+OUTBOX_BATCH_SIZE, and calls the consumers registered for each topic with a
+run of consecutive events of that topic. Rows are deleted once every
+consumer succeeded; a failing run is retried with exponential backoff and
+given up on after OUTBOX_MAX_ATTEMPTS (dead_at is set, the row is kept).
+
+Events of one topic are delivered in order: while a failed event waits
+for its retry, later events of its topic wait too (payloads carry absolute
+states, so a late retry would overwrite a newer status). Other topics keep
+going. A dead event stops holding its topic up.
+
+Delivery is at least once: a crash between the consumers and the delete,
+or two workers draining the same rows, repeats events. Consumers must
+tolerate that.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from itertools import groupby
+from os import getenv
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
+
+from app.db.models import OutboxEvent
+from app.db.sessions import async_session_maker
+from app.metrics import Counter, registry
+
+logger = logging.getLogger("app.outbox")
+
+OUTBOX_BATCH_SIZE = int(getenv("OUTBOX_BATCH_SIZE", "100"))
+# Fallback poll, for rows written by other workers or left by a crash
+OUTBOX_POLL_INTERVAL = float(getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE = float(getenv("OUTBOX_RETRY_BASE", "0.5"))
+
+# consumer(session, payloads) for one run of same-topic events
+Consumer = Callable[[AsyncSession, list[dict]], Awaitable[None]]
+
+
+class Outbox:
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        batch_size: int,
+        poll_interval: float,
+        max_attempts: int,
+        retry_base: float,
+    ):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.consumers: dict[str, list[Consumer]] = {}
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def consumer(self, topic: str):
+        """Register a consumer for a topic; usable as a decorator."""
+
+        def register(fn: Consumer) -> Consumer:
+            self.consumers.setdefault(topic, []).append(fn)
+            return fn
+
+        return register
+
+    @staticmethod
+    def add(session: AsyncSession, topic: str, payload: dict) -> None:
+        session.add(OutboxEvent(topic=topic, payload=payload))
+
+    def notify(self) -> None:
+        """Wake the dispatcher after a commit that added events."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _deliver(self, session: AsyncSession, topic: str, events: list[OutboxEvent]) -> None:
+        payloads = [event.payload for event in events]
+        for consumer in self.consumers.get(topic, ()):
+            await consumer(session, payloads)
+
+    async def dispatch_once(self, session: AsyncSession | None = None) -> int:
+        """Deliver one batch; returns how many events were handled."""
+        if session is None:
+            async with self.session_maker() as session:
+                return await self.dispatch_once(session)
+
+        now = datetime.utcnow()
+        waiting = aliased(OutboxEvent)
+        held_up = exists().where(
+            waiting.topic == OutboxEvent.topic,
+            waiting.id < OutboxEvent.id,
+            waiting.dead_at.is_(None),
+            waiting.available_at > now,
+        )
+        result = await session.execute(
+            select(OutboxEvent)
+            .where(OutboxEvent.dead_at.is_(None), OutboxEvent.available_at <= now, ~held_up)
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+        )
+        events = result.scalars().all()
+        if not events:
+            return 0
+
+        done = []
+        failed = set()
+        for topic, run in groupby(events, key=lambda event: event.topic):
+            if topic in failed:
+                # Left for after the failed run's retry
+                continue
+            run = list(run)
+            try:
+                await self._deliver(session, topic, run)
+            except Exception as e:
+                logger.exception("outbox consumer for %s failed", topic)
+                FAILURES_TOTAL.inc(topic)
+                failed.add(topic)
+                for event in run:
+                    event.attempts += 1
+                    event.last_error = repr(e)
+                    if event.attempts >= self.max_attempts:
+                        event.dead_at = now
+                    else:
+                        delay = self.retry_base * 2 ** (event.attempts - 1)
+                        event.available_at = now + timedelta(seconds=delay)
+            else:
+                DISPATCHED_TOTAL.inc(topic, amount=len(run))
+                done.extend(event.id for event in run)
+
+        if done:
+            await session.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(done)))
+        await session.commit()
+        return len(events)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                # Keep going while batches come back full
+                while await self.dispatch_once() == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("outbox dispatch failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wake = None
+
+
+outbox = Outbox(
+    async_session_maker,
+    batch_size=OUTBOX_BATCH_SIZE,
+    poll_interval=OUTBOX_POLL_INTERVAL,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+    retry_base=OUTBOX_RETRY_BASE,
+)
+
+DISPATCHED_TOTAL = registry.register(
+    Counter("outbox_dispatched_total", "Outbox events delivered to every consumer", ("topic",))
+)
+FAILURES_TOTAL = registry.register(
+    Counter("outbox_failures_total", "Outbox consumer runs that raised", ("topic",))
+)
@@ -0,0 +1,223 @@
+"""
+Token-bucket rate limits for expensive routes, answered with 429 + Retry-After.
+
+Each limit is "N/seconds": bursts of N, refilled at N per `seconds`.
+
+    POST /auth/login/    every attempt per client IP (LOGIN_RATE_LIMIT), and
+                         failed attempts per account (LOGIN_FAILURE_RATE_LIMIT)
+    POST /order/create   per client IP (ORDER_IP_RATE_LIMIT), and per
+                         authenticated user (ORDER_RATE_LIMIT) when the
+                         request has a valid bearer token
+
+Account buckets are never keyed on a bare body field, so a stranger can't
+exhaust someone else's orders, and only failed logins count against an
+email. All buckets of a request are checked before any token is taken.
+
+Buckets are stored GCRA-style: one float per key (the time the bucket will
+be full again), so a key whose time has passed holds no state and is
+evicted lazily. RATE_LIMIT_BACKEND=memory keeps them per process; a
+sqlite:///path (ideally on tmpfs) shares them between the workers of one
+host.
+"""
+import math
+import sqlite3
+import threading
+from os import getenv
+from time import time
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.deps import get_optional_principal
+from app.metrics import Counter, registry
+
+RATE_LIMIT_ENABLED = getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Use the first X-Forwarded-For address; only behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+LOGIN_RATE_LIMIT = getenv("LOGIN_RATE_LIMIT", "10/60")
+LOGIN_FAILURE_RATE_LIMIT = getenv("LOGIN_FAILURE_RATE_LIMIT", "20/300")
+ORDER_RATE_LIMIT = getenv("ORDER_RATE_LIMIT", "20/60")
+# Higher: a campus shares a handful of NAT addresses
+ORDER_IP_RATE_LIMIT = getenv("ORDER_IP_RATE_LIMIT", "120/60")
+
+# (key, capacity, seconds per token)
+Bucket = tuple[str, int, float]
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> time at which the bucket is full again
+        self.full_at: dict[str, float] = {}
+
+    def take(self, buckets: list[Bucket], now: float, consume: bool = True) -> list[float]:
+        """Seconds until each bucket has a token (<= 0: has one now).
+
+        With `consume`, one token is taken from every bucket, but only if all
+        of them have one.
+        """
+        waits = []
+        updates = []
+        for key, capacity, interval in buckets:
+            full_at = max(self.full_at.get(key, now), now) + interval
+            waits.append(full_at - now - capacity * interval)
+            updates.append((key, full_at))
+        if consume and max(waits) <= 0:
+            for key, full_at in updates:
+                if key not in self.full_at and len(self.full_at) >= self.max_keys:
+                    self._evict(now)
+                self.full_at[key] = full_at
+        return waits
+
+    def _evict(self, now: float) -> None:
+        expired = [key for key, full_at in self.full_at.items() if full_at <= now]
+        if not expired:
+            # Everything is active; drop the oldest tenth
+            expired = list(self.full_at)[: max(1, self.max_keys // 10)]
+        for key in expired:
+            del self.full_at[key]
+
+    def clear(self) -> None:
+        self.full_at.clear()
+
+
+class SQLiteBackend:
+    """Shared by every worker that opens the same file; ~30 µs per key on tmpfs.
+
+    Blocking: called from the thread pool, never on the event loop.
+    """
+
+    def __init__(self, path: str, max_keys: int):
+        self.path = path
+        self.max_keys = max_keys
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Losing buckets in a crash is harmless
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("PRAGMA busy_timeout=1000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, full_at REAL NOT NULL)"
+        )
+
+    def take(self, buckets: list[Bucket], now: float, consume: bool = True) -> list[float]:
+        with self.lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE" if consume else "BEGIN")
+            try:
+                waits = []
+                updates = []
+                for key, capacity, interval in buckets:
+                    row = conn.execute(
+                        "SELECT full_at FROM rate_limits WHERE key = ?", (key,)
+                    ).fetchone()
+                    full_at = max(row[0] if row else now, now) + interval
+                    waits.append(full_at - now - capacity * interval)
+                    updates.append((key, full_at))
+                if consume and max(waits) <= 0:
+                    conn.executemany(
+                        "INSERT INTO rate_limits (key, full_at) VALUES (?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET full_at = excluded.full_at",
+                        updates,
+                    )
+                    self.writes += 1
+                    if self.writes % self.max_keys == 0:
+                        conn.execute("DELETE FROM rate_limits WHERE full_at <= ?", (now,))
+            finally:
+                conn.execute("COMMIT")
+        return waits
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM rate_limits")
+
+
+def build_backend(url: str, max_keys: int) -> MemoryBackend | SQLiteBackend:
+    if url == "memory":
+        return MemoryBackend(max_keys)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url.removeprefix("sqlite:///"), max_keys)
+    raise ValueError(f"unknown RATE_LIMIT_BACKEND {url!r}")
+
+
+backend = build_backend(RATE_LIMIT_BACKEND, RATE_LIMIT_MAX_KEYS)
+
+LIMITED_TOTAL = registry.register(
+    Counter("rate_limited_total", "Requests answered 429 by a rate limit", ("limit",))
+)
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    def __init__(self, name: str, spec: str):
+        count, seconds = spec.split("/")
+        self.name = name
+        self.capacity = int(count)
+        # Seconds per token
+        self.interval = float(seconds) / self.capacity
+
+    def bucket(self, key: str) -> Bucket:
+        return f"{self.name}:{key}", self.capacity, self.interval
+
+    async def check(self, *keys: str) -> None:
+        await check(*(self.bucket(key) for key in keys))
+
+    async def by_ip(self, request: Request) -> None:
+        """Dependency: limit by client IP."""
+        await self.check(f"ip:{client_ip(request)}")
+
+
+async def _take(buckets: tuple[Bucket, ...], consume: bool) -> list[float]:
+    if isinstance(backend, MemoryBackend):
+        return backend.take(list(buckets), time(), consume)
+    # The shared backend may wait on another worker's lock
+    return await run_in_threadpool(backend.take, list(buckets), time(), consume)
+
+
+async def check(*buckets: Bucket, consume: bool = True) -> None:
+    """429 unless every bucket has a token; with `consume`, take them."""
+    if not RATE_LIMIT_ENABLED or not buckets:
+        return
+    waits = await _take(buckets, consume)
+    wait = max(waits)
+    if wait > 0:
+        key = buckets[waits.index(wait)][0]
+        LIMITED_TOTAL.inc(key.split(":", 1)[0])
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+async def charge(*buckets: Bucket) -> None:
+    """Take a token after the fact, e.g. for a failed login; never raises."""
+    if RATE_LIMIT_ENABLED:
+        await _take(buckets, True)
+
+
+login_limit = RateLimit("login", LOGIN_RATE_LIMIT)
+login_failure_limit = RateLimit("login_failure", LOGIN_FAILURE_RATE_LIMIT)
+order_create_limit = RateLimit("order_create", ORDER_RATE_LIMIT)
+order_create_ip_limit = RateLimit("order_create_ip", ORDER_IP_RATE_LIMIT)
+
+
+async def limit_order_create(
+    request: Request,
+    principal: str | None = Depends(get_optional_principal),
+) -> None:
+    """Dependency for POST /order/create."""
+    buckets = [order_create_ip_limit.bucket(f"ip:{client_ip(request)}")]
+    if principal is not None:
+        buckets.append(order_create_limit.bucket(f"user:{principal}"))
+    await check(*buckets)
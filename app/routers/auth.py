@@ -1,15 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from app.db.schemas.auth import LoginRequest
-from sqlalchemy import select
+from sqlalchemy import select, delete, insert
+from sqlalchemy.exc import IntegrityError
+from jose import jwt
+from jose.exceptions import JWTError
+from pydantic import ValidationError
 from app.db import sessions
-from app.db.models import Users
+from app.db.models import Users, RevokedToken
 from app.db.schemas import users as user_schemas
 from app.db.schemas import auth as auth_schemas
+from app.deps import get_current_user, invalidate_user, user_cache
+from app.loop_monitor import shed_when_lagging
+from app import rate_limit
+from app.rate_limit import client_ip, login_failure_limit, login_limit
 from app.utils import (
-    get_password_hash,
-    verify_password,
+    ALGORITHM,
+    JWT_REFRESH_SECRET_KEY,
+    get_password_hash_async,
+    hash_passwords_parallel,
+    verify_and_update_password_async,
     create_access_token,
     create_refresh_token,
+    revoked_refresh_tokens,
 )
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
@@ -17,6 +34,10 @@ from sqlalchemy.ext.asyncio import (
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+auth_user_dependency = Annotated[Users, Depends(get_current_user)]
+
+BULK_BATCH_SIZE = 500
+
 
 @router.post("/register/", summary="Register a new user")
 async def register_user(
@@ -34,7 +55,7 @@ async def register_user(
 
     user = Users(
         email=payload.email,
-        password=get_password_hash(payload.password),
+        password=await get_password_hash_async(payload.password),
         name=payload.name,
     )
     db.add(user)
@@ -43,6 +64,100 @@ async def register_user(
     return "ok"
 
 
+async def _read_bulk_rows(request: Request) -> list[dict]:
+    """Rows from a CSV (email,name,password header) or JSON list body."""
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+
+    try:
+        if "csv" in request.headers.get("content-type", ""):
+            return list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+        rows = json.loads(body)
+    except ValueError:
+        # UnicodeDecodeError and JSONDecodeError are both ValueErrors
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or CSV")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or CSV")
+    return rows
+
+
+@router.post(
+    "/register/bulk",
+    summary="Register many users from a CSV or JSON list",
+    response_model=auth_schemas.BulkRegisterResult,
+    dependencies=[Depends(shed_when_lagging)],
+)
+async def register_users_bulk(
+    request: Request,
+    current_user: auth_user_dependency,
+    db: AsyncSession = Depends(sessions.get_async_session),
+):
+    rows = await _read_bulk_rows(request)
+    results: list[dict] = [{} for _ in rows]
+
+    # 1️⃣ Validate rows and drop duplicates within the upload
+    pending: dict[str, tuple[int, user_schemas.UsersCreate]] = {}
+    for i, raw in enumerate(rows):
+        try:
+            user = user_schemas.UsersCreate.model_validate(raw)
+        except ValidationError as e:
+            email = raw.get("email") if isinstance(raw, dict) else None
+            if not isinstance(email, str):
+                email = None
+            results[i] = {"row": i, "email": email, "status": "invalid",
+                          "detail": e.errors()[0]["msg"]}
+            continue
+        if user.email in pending:
+            results[i] = {"row": i, "email": user.email, "status": "duplicate"}
+            continue
+        pending[user.email] = (i, user)
+
+    # 2️⃣ One IN query per chunk for emails that already exist
+    emails = list(pending)
+    for start in range(0, len(emails), BULK_BATCH_SIZE):
+        chunk = emails[start : start + BULK_BATCH_SIZE]
+        existing = await db.scalars(select(Users.email).where(Users.email.in_(chunk)))
+        for email in existing:
+            i, _ = pending.pop(email)
+            results[i] = {"row": i, "email": email, "status": "exists"}
+
+    # 3️⃣ Hash in parallel and insert one transaction per batch
+    created = 0
+    new_users = list(pending.values())
+    for start in range(0, len(new_users), BULK_BATCH_SIZE):
+        batch = new_users[start : start + BULK_BATCH_SIZE]
+        hashes = await hash_passwords_parallel([u.password for _, u in batch])
+        values = [
+            {"email": u.email, "name": u.name, "password": h}
+            for (_, u), h in zip(batch, hashes)
+        ]
+        try:
+            await db.execute(insert(Users), values)
+            await db.commit()
+        except IntegrityError:
+            # Someone registered one of these emails since step 2: insert the
+            # batch row by row so only the conflicting rows are reported
+            await db.rollback()
+            for (i, u), value in zip(batch, values):
+                try:
+                    await db.execute(insert(Users), [value])
+                    await db.commit()
+                except IntegrityError:
+                    await db.rollback()
+                    results[i] = {"row": i, "email": u.email, "status": "exists",
+                                  "detail": "Email registered concurrently"}
+                    continue
+                created += 1
+                results[i] = {"row": i, "email": u.email, "status": "created"}
+            continue
+        created += len(batch)
+        for i, u in batch:
+            results[i] = {"row": i, "email": u.email, "status": "created"}
+
+    return {"created": created, "results": results}
+
+
 @router.post(
     "/login/",
     summary="Create access and refresh tokens for user",
@@ -50,27 +165,39 @@ async def register_user(
 )
 async def login(
     payload: LoginRequest,
+    request: Request,
     db: AsyncSession = Depends(sessions.get_async_session),
 ):
+    # Only failures count against the account, so guessing one password
+    # from many IPs is slow but a stranger can't lock out a correct login
+    # for long. Check both buckets before taking the IP token.
+    account = login_failure_limit.bucket(f"user:{payload.email.lower()}")
+    await rate_limit.check(account, consume=False)
+    await login_limit.check(f"ip:{client_ip(request)}")
+
     q = await db.scalars(select(Users).filter(Users.email == payload.email))
     user = q.first()
 
     if user is None:
+        await rate_limit.charge(account)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect email or password",
         )
 
     hashed_pass = user.password
-    if not verify_password(payload.password, hashed_pass):
+    valid, new_hash = await verify_and_update_password_async(
+        payload.password, hashed_pass
+    )
+    if not valid:
+        await rate_limit.charge(account)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect email or password",
         )
 
     jwt_data = {"sub": user.email}
-
-    return {
+    token = {
         "access_token": create_access_token(jwt_data),
         "refresh_token": create_refresh_token(jwt_data),
         "user_id": user.id,
@@ -78,6 +205,82 @@ async def login(
         "email": user.email,
     }
 
+    # Stored hash uses an outdated bcrypt cost: replace it with the one
+    # verify_and_update already computed from the plaintext.
+    if new_hash is not None:
+        user.password = new_hash
+        await db.commit()
+        invalidate_user(token["email"])
+
+    return token
+
+@router.post(
+    "/refresh",
+    summary="Exchange a refresh token for a new access/refresh pair",
+    response_model=auth_schemas.Token,
+)
+async def refresh(
+    payload: auth_schemas.RefreshRequest,
+    db: AsyncSession = Depends(sessions.get_async_session),
+):
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = jwt.decode(
+            payload.refresh_token, JWT_REFRESH_SECRET_KEY, algorithms=[ALGORITHM]
+        )
+        token_data = auth_schemas.TokenPayload(**claims)
+    except (JWTError, ValidationError):
+        raise invalid
+
+    if token_data.type != "refresh":
+        raise invalid
+    if not token_data.sub or not token_data.jti or not token_data.exp:
+        raise invalid
+    if revoked_refresh_tokens.get(token_data.jti):
+        raise invalid
+
+    user = user_cache.get(token_data.sub)
+    if user is None:
+        q = await db.scalars(select(Users).filter(Users.email == token_data.sub))
+        user = q.first()
+        if user is None:
+            raise invalid
+
+    user_id, user_name, email = user.id, user.name, user.email
+
+    # Rotation: the old jti is revoked in the same step that checks it, so a
+    # token replayed on another worker hits the primary key and fails.
+    now = datetime.utcnow()
+    db.add(
+        RevokedToken(
+            jti=token_data.jti,
+            expires_at=datetime.utcfromtimestamp(token_data.exp),
+        )
+    )
+    await db.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        revoked_refresh_tokens.set(token_data.jti, True, expires_at=token_data.exp)
+        raise invalid
+    revoked_refresh_tokens.set(token_data.jti, True, expires_at=token_data.exp)
+
+    jwt_data = {"sub": email}
+
+    return {
+        "access_token": create_access_token(jwt_data),
+        "refresh_token": create_refresh_token(jwt_data),
+        "user_id": user_id,
+        "user_name": user_name,
+        "email": email,
+    }
+
+
 @router.put("/edit/{user_id}", summary="Edit user details")
 async def edit_user(
     user_id: int,
@@ -92,12 +295,15 @@ async def edit_user(
     data = updated_user.model_dump(exclude_unset=True)
 
     if "password" in data:
-        hashed_pw = get_password_hash(data["password"].encode("utf-8"))
+        hashed_pw = await get_password_hash_async(data["password"].encode("utf-8"))
         data["password"] = hashed_pw
 
+    old_email = user.email
     for key, value in data.items():
         setattr(user, key, value)
 
     await db.commit()
     await db.refresh(user)
+    invalidate_user(old_email, user_id)
+    invalidate_user(user.email)
     return {"message": "User updated successfully"}
\ No newline at end of file
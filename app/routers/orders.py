@@ -1,64 +1,95 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime
 from typing import Set, Dict
 import random
+from time import perf_counter
 from app.db.models import Users, Products
-from app.db.sessions import get_async_session, async_session_maker
+from app.db.sessions import (
+    get_async_session,
+    async_session_maker,
+    mark_user_write,
+)
 from app.db.models import Order as OrderModel
-from app.db.schemas.orders import OrderSend, Order, OrderItem, OrderUpdate
+from app.deps import get_read_session, get_websocket_principal
+from app.db.schemas.orders import OrderSend, Order, OrderItem, OrderUpdate, OrderFilters
+from pydantic import ValidationError
+from app.serialization import columns_for, rows_response
+from app.metrics import BROADCAST_DURATION
+from app.db.instrumentation import query_budget
+from app.loop_monitor import shed_when_lagging
+from app.ws import ws_connections
+from app.order_stream import PROTOCOL_V2_BINARY, OrderEvent, OrderStream, negotiate, order_data
+from app.user_events import LONG_POLL_TIMEOUT, sse_stream, user_events
+from app.subscriptions import FILTER_FIELDS, SubscriptionRouter, prod_types_for
+from app.outbox import outbox
+from app.rate_limit import limit_order_create
+from app.single_flight import single_flight
 
 router = APIRouter(prefix="/order", tags=["order"])
 
 # ============================================================
 #   ACTIVE WEBSOCKET CONNECTIONS STORAGE
 # ============================================================
-active_connections: Set[WebSocket] = set()
+# /order/ws sockets, indexed by their filters (app.subscriptions)
+order_subscribers = SubscriptionRouter()
 # Store WebSocket connections per user_id
 user_connections: Dict[int, Set[WebSocket]] = {}
 
 
-async def broadcast_order(order: OrderModel, message_type: str = "order_update"):
-    """Send order updates to all WebSocket subscribers"""
-    message = {
-        "type": message_type,
-        "data": {
-            "id": order.id,
-            "user_id": order.user_id,
-            "user_name": order.user_name,
-            "code": order.code,
-            "items": order.items,
-            "price": order.price,
-            "comment": order.comment,
-            "status": order.status,
-            "timestamp": order.timestamp.isoformat()
-        }
+async def broadcast_order(
+    data: dict,
+    message_type: str = "order_update",
+    changed: tuple[str, ...] | None = None,
+    prod_types: set[str] = frozenset(),
+    previous_status: str | None = None,
+):
+    """Send order updates to the WebSocket subscribers whose filters match
+
+    `data` is the order as order_data() returns it. `changed` names the
+    fields that changed; v2 clients that already have the order only
+    receive those.
+    """
+    event = OrderEvent(message_type, data, changed)
+    keys = {
+        "order_id": (data["id"],),
+        "code": (data["code"],),
+        "prod_type": prod_types,
+        "status": (data["status"], previous_status),
     }
 
+    started = perf_counter()
     dead = []
-    for ws in active_connections:
+    for subscription in order_subscribers.match(keys):
         try:
-            await ws.send_json(message)
+            await subscription.stream.send(subscription.websocket, event)
         except:
-            dead.append(ws)
+            dead.append(subscription.websocket)
 
     for ws in dead:
-        active_connections.remove(ws)
+        order_subscribers.unsubscribe(ws)
+    BROADCAST_DURATION.observe(perf_counter() - started, "orders")
 
 
 async def broadcast_to_user(user_id: int, order_id: int, status: str):
-    """Send order status update to specific user's WebSocket connections"""
-    if user_id not in user_connections:
-        return
-    
+    """Send order status update to specific user's WebSocket connections
+
+    Also published to app.user_events for SSE and long-poll clients.
+    """
     # 🔥 FIXED: Added proper type segregation
     message = {
         "type": "status_changed",  # Clear type for status updates
         "order_id": order_id,
         "status": status
     }
+    user_events.publish(user_id, message)
+
+    if user_id not in user_connections:
+        return
     
+    started = perf_counter()
     dead = []
     for ws in user_connections[user_id]:
         try:
@@ -73,9 +104,10 @@ async def broadcast_to_user(user_id: int, order_id: int, status: str):
     # Remove empty sets
     if not user_connections[user_id]:
         del user_connections[user_id]
+    BROADCAST_DURATION.observe(perf_counter() - started, "user")
 
 
-@router.post("/broadcast")
+@router.post("/broadcast", dependencies=[Depends(shed_when_lagging)])
 async def broadcast_order_update(
     db: AsyncSession = Depends(get_async_session)
 ):
@@ -95,6 +127,94 @@ async def broadcast_order_update(
 
 
 
+# ============================================================
+#  SSE / LONG POLL — STATUS UPDATES WITHOUT A WEBSOCKET
+# ============================================================
+@router.get("/events/{user_id}")
+async def user_order_events(
+    user_id: int,
+    last_event_id: int | None = Header(default=None),
+):
+    """
+    Server-Sent Events with the same status_changed messages as
+    /ws/updates/{user_id}. EventSource resumes with Last-Event-ID; a
+    {"type": "resync"} message means events were missed and the client
+    should refetch /order/{user_id}.
+    """
+    return StreamingResponse(
+        sse_stream(user_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/poll/{user_id}")
+async def poll_user_order_events(
+    user_id: int,
+    after: int | None = None,
+    timeout: float = Query(default=LONG_POLL_TIMEOUT, ge=0, le=LONG_POLL_TIMEOUT),
+):
+    """
+    Long poll: returns as soon as there are status_changed events newer than
+    `after`, or an empty list after `timeout` seconds. Pass the returned
+    last_event_id as `after` on the next call.
+    """
+    if after is None:
+        after = user_events.last_id
+    events, truncated = await user_events.wait(user_id, after, timeout)
+    return {
+        "events": [message for _, message in events],
+        "last_event_id": events[-1][0] if events else after,
+        "resync": truncated,
+    }
+
+
+# ============================================================
+#  OUTBOX CONSUMERS — BROADCASTS RUN AFTER THE REQUEST (app.outbox)
+# ============================================================
+async def _load_orders(session: AsyncSession, payloads: list[dict]) -> dict[int, OrderModel]:
+    ids = {payload["order_id"] for payload in payloads}
+    result = await session.execute(select(OrderModel).where(OrderModel.id.in_(ids)))
+    return {order.id: order for order in result.scalars()}
+
+
+@outbox.consumer("order_created")
+async def deliver_order_created(session: AsyncSession, payloads: list[dict]) -> None:
+    if not order_subscribers:
+        return
+    orders = await _load_orders(session, payloads)
+    for payload in payloads:
+        order = orders.get(payload["order_id"])
+        if order is None:  # deleted since
+            continue
+        data = order_data(order)
+        data["status"] = payload["status"]
+        await broadcast_order(data, "order_created", prod_types=set(payload["prod_types"]))
+
+
+@outbox.consumer("order_status_changed")
+async def deliver_status_changed(session: AsyncSession, payloads: list[dict]) -> None:
+    for payload in payloads:
+        await broadcast_to_user(payload["user_id"], payload["order_id"], payload["status"])
+
+    if not order_subscribers:
+        return
+    orders = await _load_orders(session, payloads)
+    for payload in payloads:
+        order = orders.get(payload["order_id"])
+        if order is None:
+            continue
+        # The row may have moved on; send the status this event is about
+        data = order_data(order)
+        data["status"] = payload["status"]
+        await broadcast_order(
+            data,
+            changed=("status",),
+            prod_types=await prod_types_for(session, order.items),
+            previous_status=payload["previous_status"],
+        )
+
+
 # ============================================================
 #  UNIQUE ORDER CODE GENERATOR
 # ============================================================
@@ -118,18 +238,24 @@ async def generate_unique_code(session: AsyncSession) -> str:
 # ============================================================
 #  GET ORDERS
 # ============================================================
+order_columns = columns_for(OrderModel, Order)
+
+
 @router.get("/all", response_model=list[Order])
-async def get_all_orders(db: AsyncSession = Depends(get_async_session)):
-    result = await db.execute(select(OrderModel).where(OrderModel.status.not_in(["paid", "cancelled"])))
-    return result.scalars().all()
+@query_budget(1)
+@single_flight
+async def get_all_orders(db: AsyncSession = Depends(get_read_session)):
+    result = await db.execute(select(*order_columns).where(OrderModel.status.not_in(["paid", "cancelled"])))
+    return rows_response(result.mappings())
 
 
 @router.get("/{user_id}", response_model=list[Order])
-async def get_user_orders(user_id: int, db: AsyncSession = Depends(get_async_session)):
+@query_budget(1)
+async def get_user_orders(user_id: int, db: AsyncSession = Depends(get_read_session)):
     result = await db.execute(
-        select(OrderModel).where(OrderModel.user_id == user_id).order_by(OrderModel.timestamp.asc())
+        select(*order_columns).where(OrderModel.user_id == user_id).order_by(OrderModel.timestamp.asc())
     )
-    return result.scalars().all()
+    return rows_response(result.mappings())
 
 
 # ============================================================
@@ -152,7 +278,7 @@ async def delete_order(order_id: int, db: AsyncSession = Depends(get_async_sessi
 # ============================================================
 #  POST — CREATE ORDER
 # ============================================================
-@router.post("/create", response_model=Order)
+@router.post("/create", response_model=Order, dependencies=[Depends(limit_order_create)])
 async def create_order(
     order: OrderSend,
     session: AsyncSession = Depends(get_async_session)
@@ -170,6 +296,7 @@ async def create_order(
     code = await generate_unique_code(session)
 
     # 3️⃣ Check and update product quantities
+    prod_types = set()
     for item in order.items:
         # Get the product
         product_result = await session.execute(
@@ -191,6 +318,7 @@ async def create_order(
             
         # Update the quantity
         product.quantity -= item.quantity
+        prod_types.add(product.prod_type)
 
     # 4️⃣ Create order
     new_order = OrderModel(
@@ -206,6 +334,13 @@ async def create_order(
     session.add(new_order)
     
     try:
+        await session.flush()
+        # 5️⃣ Broadcast to websocket listeners, once committed (app.outbox)
+        outbox.add(session, "order_created", {
+            "order_id": new_order.id,
+            "status": new_order.status,
+            "prod_types": sorted(prod_types),
+        })
         await session.commit()
         await session.refresh(new_order)
     except Exception as e:
@@ -215,8 +350,9 @@ async def create_order(
             detail=f"Error creating order: {str(e)}"
         )
 
-    # 5️⃣ Broadcast to websocket listeners
-    await broadcast_order(new_order, message_type="order_created")
+    # The buyer's next /order/{user_id} must see this order even on a lagging replica
+    mark_user_write(new_order.user_id)
+    outbox.notify()
 
     return new_order
 
@@ -242,18 +378,22 @@ async def update_order_status(
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Update status
+    previous_status = order.status
     order.status = update_data.status
+
+    # 🔔 Broadcast to the user's and the kitchen's sockets once committed
+    outbox.add(db, "order_status_changed", {
+        "order_id": order.id,
+        "user_id": order.user_id,
+        "status": order.status,
+        "previous_status": previous_status,
+    })
     
     try:
         await db.commit()
         await db.refresh(order)
-        
-        # 🔔 Broadcast to the specific user's WebSocket connections
-        await broadcast_to_user(
-            user_id=order.user_id,
-            order_id=order.id,
-            status=order.status
-        )
+        mark_user_write(order.user_id)
+        outbox.notify()
         
         return order
     except Exception as e:
@@ -273,28 +413,69 @@ async def orders_websocket(websocket: WebSocket):
     - connection_established: Initial connection confirmation
     - order_created: New order created
     - order_update: Order data updated
+    - order_delta: Changed fields of an order the socket already has (v2)
     - pong: Response to ping
+    - ping: Server heartbeat; answer with {"action": "pong"}
+    - retry: Connection refused, reconnect after "retry_after" seconds
+    - subscribed: Filters now in effect
+    - error: Invalid subscribe message
+
+    Protocol versions are negotiated by subprotocol, see app.order_stream.
+    Only events matching the socket's filters are sent (app.subscriptions);
+    set them with query parameters (?prod_type=drink,dessert&status=ready)
+    or {"action": "subscribe", "filters": {...}}.
     """
-    await websocket.accept()
-    active_connections.add(websocket)
+    try:
+        filters = OrderFilters.model_validate({
+            field: websocket.query_params[field].split(",")
+            for field in FILTER_FIELDS
+            if websocket.query_params.get(field)
+        })
+    except ValidationError:
+        filters = None
+
+    subprotocol = negotiate(websocket)
+    binary = subprotocol == PROTOCOL_V2_BINARY
+    if not await ws_connections.accept(websocket, subprotocol=subprotocol, binary=binary):
+        return
+    if filters is None:
+        await websocket.close(code=1008, reason="invalid filters")
+        ws_connections.discard(websocket)
+        return
+    stream = OrderStream(subprotocol)
+    order_subscribers.subscribe(websocket, stream, filters.model_dump(exclude_none=True))
     
     try:
-        await websocket.send_json({
+        await stream.send_message(websocket, {
             "type": "connection_established",
-            "message": "Connected to order updates"
+            "message": "Connected to order updates",
+            "version": stream.version,
         })
         
         while True:
             data = await websocket.receive_json()
+            ws_connections.touch(websocket)
             if data.get("action") == "ping":
-                await websocket.send_json({"type": "pong"})
+                await stream.send_message(websocket, {"type": "pong"})
+            elif data.get("action") == "subscribe":
+                try:
+                    filters = OrderFilters.model_validate(data.get("filters") or {})
+                except ValidationError as e:
+                    await stream.send_message(
+                        websocket, {"type": "error", "detail": e.errors(include_url=False)}
+                    )
+                    continue
+                wanted = filters.model_dump(exclude_none=True)
+                order_subscribers.subscribe(websocket, stream, wanted)
+                await stream.send_message(websocket, {"type": "subscribed", "filters": wanted})
                 
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        order_subscribers.unsubscribe(websocket)
     except Exception as e:
         print(f"WebSocket error: {str(e)}")
     finally:
-        active_connections.discard(websocket)
+        order_subscribers.unsubscribe(websocket)
+        ws_connections.discard(websocket)
 @router.websocket("/ws/updates/{user_id}")
 async def user_order_updates_websocket(websocket: WebSocket, user_id: int):
     """
@@ -319,8 +500,23 @@ async def user_order_updates_websocket(websocket: WebSocket, user_id: int):
        {
            "type": "pong"
        }
+
+    4. ping: Server heartbeat every WS_PING_INTERVAL seconds. Clients must
+       send something (e.g. {"action": "pong"}) within WS_IDLE_TIMEOUT.
+
+    5. retry: Sent before a 1013 close when the connection is refused
+       {
+           "type": "retry",
+           "reason": str,
+           "retry_after": float
+       }
+
+    Sockets that send an access token (?token=...) count against its
+    user's WS_MAX_PER_USER; anonymous ones only against the global limits.
     """
-    await websocket.accept()
+    principal = get_websocket_principal(websocket)
+    if not await ws_connections.accept(websocket, principal):
+        return
     if user_id not in user_connections:
         user_connections[user_id] = set()
     user_connections[user_id].add(websocket)
@@ -334,6 +530,7 @@ async def user_order_updates_websocket(websocket: WebSocket, user_id: int):
         
         while True:
             data = await websocket.receive_json()
+            ws_connections.touch(websocket)
             
             if data.get("action") == "ping":
                 await websocket.send_json({"type": "pong"})
@@ -343,6 +540,7 @@ async def user_order_updates_websocket(websocket: WebSocket, user_id: int):
     except Exception as e:
         print(f"WebSocket error for user {user_id}: {str(e)}")
     finally:
+        ws_connections.discard(websocket)
         if user_id in user_connections:
             user_connections[user_id].discard(websocket)
             if not user_connections[user_id]:
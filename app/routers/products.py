@@ -1,9 +1,15 @@
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db import sessions
+from app.deps import get_read_session
 from app.db.models import Products
 from app.db.schemas import products as products_schema
+from app.serialization import columns_for, rows_response
+from app.db.instrumentation import query_budget
+from app.subscriptions import product_type_cache
+from app.single_flight import single_flight
 import uuid
 import shutil
 import os
@@ -18,6 +24,16 @@ router = APIRouter(
 UPLOAD_DIR = "app/static/products"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+
+def save_upload(image: UploadFile) -> str:
+    """Copy the upload into UPLOAD_DIR; blocking, run it in the threadpool."""
+    extension = image.filename.split(".")[-1]
+    filename = f"{uuid.uuid4()}.{extension}"
+    filepath = os.path.join(UPLOAD_DIR, filename)
+    with open(filepath, "wb") as buffer:
+        shutil.copyfileobj(image.file, buffer)
+    return f"/static/products/{filename}"
+
 @router.post("/post", response_model=products_schema.ProductBase)
 async def create_product(
     name: str = Form(...),
@@ -27,13 +43,7 @@ async def create_product(
     image: UploadFile = File(...),
     db: AsyncSession = Depends(sessions.get_async_session)
 ):
-    extension = image.filename.split(".")[-1]
-    filename = f"{uuid.uuid4()}.{extension}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
-    with open(filepath, "wb") as buffer:
-        shutil.copyfileobj(image.file, buffer)
-
-    db_path = f"/static/products/{filename}" 
+    db_path = await run_in_threadpool(save_upload, image)
 
     existing_product = await db.execute(select(Products).where(Products.name == name))
     if existing_product.scalar_one_or_none():
@@ -58,14 +68,19 @@ async def create_product(
 
     return item
 
+product_columns = columns_for(Products, products_schema.ProductBase)
+
+
 @router.get("/", response_model=list[products_schema.ProductBase])
-async def get_all_products(db: AsyncSession = Depends(sessions.get_async_session)):
-    result = await db.execute(select(Products))
-    return result.scalars().all()
+@query_budget(1)
+@single_flight
+async def get_all_products(db: AsyncSession = Depends(get_read_session)):
+    result = await db.execute(select(*product_columns))
+    return rows_response(result.mappings())
 
 
 @router.get("/one/{prod_id}", response_model=products_schema.ProductBase)
-async def get_product(prod_id: str, db: AsyncSession = Depends(sessions.get_async_session)):
+async def get_product(prod_id: str, db: AsyncSession = Depends(get_read_session)):
     result = await db.execute(select(Products).filter(Products.id == prod_id))
     item = result.scalar_one_or_none()
     if not item:
@@ -96,13 +111,11 @@ async def update_product(
     if prod_type is not None:
         item.prod_type = prod_type
     if image is not None:
-        extension = image.filename.split(".")[-1]
-        filename = f"{uuid.uuid4()}.{extension}"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        item.image_path = f"/static/products/{filename}"
+        item.image_path = await run_in_threadpool(save_upload, image)
     await db.commit()
+    # After the commit, so a concurrent lookup can't cache the old type again
+    if prod_type is not None:
+        product_type_cache.pop(prod_id)
     await db.refresh(item)
 
     return item
@@ -134,6 +147,8 @@ async def patch_product(
     for key, value in data.items():
         setattr(item, key, value)
     await db.commit()
+    if "prod_type" in data:
+        product_type_cache.pop(prod_id)
     await db.refresh(item)
     return item
 
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select, delete
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select, delete, func, or_, and_
 from app.db import sessions
 from app.db.models import Users
 from app.db.schemas import users as user_schemas
@@ -7,42 +7,82 @@ from sqlalchemy.ext.asyncio import (
     AsyncSession,
 )
 from typing import Sequence, Annotated
-from app.deps import get_current_user
+from app.deps import get_current_user, get_read_session, invalidate_user, user_name_cache
+from app.db.instrumentation import query_budget
 
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 auth_user_dependency = Annotated[Users, Depends(get_current_user)]
 
+USER_PAGE_SIZE = 100
+USER_PAGE_MAX = 1000
+USER_NAMES_MAX = 500
+
+# id, email, name and the date part of creation_date, computed by the DB
+user_columns = (
+    Users.id,
+    Users.email,
+    Users.name,
+    func.date(Users.creation_date).label("creation_date"),
+)
+
+
 @router.get("/get/users")
 async def get_users(
     current_user: auth_user_dependency,
-    db: AsyncSession = Depends(sessions.get_async_session),
+    response: Response,
+    after_id: int | None = None,
+    limit: int = Query(USER_PAGE_SIZE, ge=1, le=USER_PAGE_MAX),
+    db: AsyncSession = Depends(get_read_session),
 ) -> Sequence[user_schemas.Users]:
-    q = select(Users)
+    """Keyset-paginated by id; pass the X-Next-After-Id header back as after_id."""
+    q = select(*user_columns).order_by(Users.id).limit(limit)
+    if after_id is not None:
+        q = q.where(Users.id > after_id)
     result = await db.execute(q)
-    users = result.scalars().all()
+    users = result.mappings().all()
 
-    if not users:
+    if not users and after_id is None:
         raise HTTPException(status_code=404, detail="No users found")
-    # Convert creation_date from datetime to date for each user
-    users_out = []
-    for user in users:
-        if hasattr(user, "creation_date") and user.creation_date is not None:
-            # Defensive: only convert if it's a datetime
-            try:
-                user.creation_date = user.creation_date.date()
-            except Exception:
-                pass
-        users_out.append(user)
+    if len(users) == limit:
+        response.headers["X-Next-After-Id"] = str(users[-1]["id"])
     return users
 
 
+@router.get("/search")
+async def search_users(
+    current_user: auth_user_dependency,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=USER_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_session),
+) -> Sequence[user_schemas.Users]:
+    """Case-insensitive prefix match on email or name."""
+    prefix = q.lower()
+    # A half-open range instead of LIKE so both indexes can be used
+    upper = prefix + "\uffff"
+    email = Users.email_lower
+    name = Users.name_lower
+    query = (
+        select(*user_columns)
+        .where(
+            or_(
+                and_(email >= prefix, email < upper),
+                and_(name >= prefix, name < upper),
+            )
+        )
+        .order_by(Users.name)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return result.mappings().all()
+
+
 @router.get("/get/user/{id}")
 async def get_user(
     current_user: auth_user_dependency,
     id: int,
-    db: AsyncSession = Depends(sessions.get_async_session),
+    db: AsyncSession = Depends(get_read_session),
 ) -> user_schemas.Users | dict:
     q = await db.scalars(select(Users).filter(Users.id == id))
     user = q.first()
@@ -60,13 +100,50 @@ async def get_user(
 @router.get("/get/user/{id}/name")
 async def get_user(
     id: int,
-    db: AsyncSession = Depends(sessions.get_async_session),
+    db: AsyncSession = Depends(get_read_session),
 ) -> user_schemas.Users | dict:
-    q = await db.scalars(select(Users).filter(Users.id == id))
-    user = q.first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return {"full_name": user.name}
+    name = user_name_cache.get(id)
+    if name is None:
+        name = await db.scalar(select(Users.name).filter(Users.id == id))
+        if name is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_name_cache.set(id, name)
+    return {"full_name": name}
+
+@router.get("/names")
+@query_budget(1)
+async def get_user_names(
+    ids: str = Query(..., description="Comma separated user ids"),
+    db: AsyncSession = Depends(get_read_session),
+) -> dict[int, str]:
+    """Names for many users at once; unknown ids are left out."""
+    try:
+        wanted = {int(part) for part in ids.split(",") if part.strip()}
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be integers")
+    if len(wanted) > USER_NAMES_MAX:
+        raise HTTPException(
+            status_code=422, detail=f"At most {USER_NAMES_MAX} ids per request"
+        )
+
+    names: dict[int, str] = {}
+    missing = []
+    for user_id in wanted:
+        name = user_name_cache.get(user_id)
+        if name is None:
+            missing.append(user_id)
+        else:
+            names[user_id] = name
+
+    if missing:
+        result = await db.execute(
+            select(Users.id, Users.name).where(Users.id.in_(missing))
+        )
+        for user_id, name in result.all():
+            user_name_cache.set(user_id, name)
+            names[user_id] = name
+
+    return names
 
 @router.delete("/delete/user/{id}")
 async def delete_user(
@@ -95,4 +172,5 @@ async def delete_user(
     q = delete(Users).filter(Users.id == id)
     await db.execute(q)
     await db.commit()
+    invalidate_user(user.email, id)
     return "ok"
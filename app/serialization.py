@@ -0,0 +1,18 @@
+from typing import Any, Iterable
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def columns_for(model: Any, schema: type[BaseModel]) -> list:
+    """ORM columns matching `schema`'s fields, in field order."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def rows_response(rows: Iterable[Any]) -> ORJSONResponse:
+    """Encode result mappings straight to JSON.
+
+    Returning a Response makes FastAPI skip the response_model round trip, so
+    use it only with a projection built by columns_for() for that same schema.
+    """
+    return ORJSONResponse([dict(row) for row in rows])
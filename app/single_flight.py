@@ -0,0 +1,91 @@
+"""
+Single-flight coalescing for hot read endpoints.
+
+    @router.get("/")
+    @single_flight
+    async def get_all_products(db: AsyncSession = Depends(get_read_session)): ...
+
+While one call of a decorated endpoint is running, identical calls (same
+endpoint, same path and query parameters) wait for it and get a copy of its
+response (body, headers and background task) instead of running their own
+query and serialization. Parameters with a Depends() default are not part
+of the key. Endpoints that take the Request, Response, BackgroundTasks or
+WebSocket can't be decorated: their calls differ in ways a key can't see.
+
+Nothing is cached: the next call after the first one finishes runs again,
+so a follower sees data at most one query old.
+
+The shared call runs as its own task, so a leader whose client goes away
+doesn't cancel the followers; if that closes the leader's session under it,
+the followers get the error.
+"""
+import asyncio
+import functools
+import inspect
+from os import getenv
+
+from fastapi import BackgroundTasks, Response, params
+from starlette.requests import HTTPConnection
+
+from app.metrics import Counter, registry
+
+SINGLE_FLIGHT_ENABLED = getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# key -> task running the shared call
+in_flight: dict[tuple, asyncio.Task] = {}
+
+# Parameter types that make every call unique (Request and WebSocket are HTTPConnections)
+PER_REQUEST = (HTTPConnection, Response, BackgroundTasks)
+
+
+def _copy(result):
+    if isinstance(result, Response):
+        # Each request needs its own Response; the body bytes are shared.
+        # The background task runs once per request, as it would uncoalesced.
+        copy = Response(
+            content=result.body,
+            status_code=result.status_code,
+            background=result.background,
+        )
+        copy.raw_headers = list(result.raw_headers)
+        return copy
+    return result
+
+
+def single_flight(fn):
+    name = f"{fn.__module__}.{fn.__qualname__}"
+    injected = set()
+    for param in inspect.signature(fn).parameters.values():
+        if isinstance(param.annotation, type) and issubclass(param.annotation, PER_REQUEST):
+            raise TypeError(f"{name}: can't coalesce an endpoint that takes {param.annotation.__name__}")
+        if isinstance(param.default, params.Depends):
+            injected.add(param.name)
+
+    @functools.wraps(fn)
+    async def wrapper(**kwargs):
+        if not SINGLE_FLIGHT_ENABLED:
+            return await fn(**kwargs)
+        key = (name,) + tuple(
+            (arg, value) for arg, value in sorted(kwargs.items()) if arg not in injected
+        )
+        task = in_flight.get(key)
+        if task is not None:
+            SHARED_TOTAL.inc(name)
+            return _copy(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(fn(**kwargs))
+        in_flight[key] = task
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    return wrapper
+
+
+SHARED_TOTAL = registry.register(
+    Counter(
+        "single_flight_shared_total",
+        "Requests answered with the response of an identical in-flight call",
+        ("endpoint",),
+    )
+)
+registry.gauge("single_flight_in_flight", "Coalesced calls currently running", lambda: len(in_flight))
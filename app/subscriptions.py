@@ -0,0 +1,131 @@
+"""
+Filtered subscriptions for /order/ws.
+
+A socket subscribes with filters on any of order_id, code, prod_type and
+status; values within a filter are OR-ed and filters are AND-ed. No filters
+means every event, as before.
+
+    /order/ws?prod_type=drink,dessert&status=pending
+    {"action": "subscribe", "filters": {"order_id": [12, 15]}}
+
+Each subscription is indexed under one of its filters, the most selective
+one (FILTER_FIELDS order), so an event only looks at subscriptions indexed
+under its own values and checks their remaining filters. An event's status
+values are the new and the previous status, so a "pending" screen also
+sees the order leave pending.
+"""
+from typing import Iterable
+
+from fastapi import WebSocket
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import TTLCache
+from app.db.models import Products
+from app.order_stream import OrderStream
+
+# Most selective first
+FILTER_FIELDS = ("order_id", "code", "prod_type", "status")
+
+# product id -> prod_type, for events about orders loaded without products
+product_type_cache = TTLCache(maxsize=10000, ttl=300)
+
+
+async def prod_types_for(db: AsyncSession, items: list[dict]) -> set[str]:
+    ids = {item["product_id"] for item in items}
+    types = {}
+    for product_id in ids:
+        prod_type = product_type_cache.get(product_id)
+        if prod_type is not None:
+            types[product_id] = prod_type
+    missing = ids - types.keys()
+    if missing:
+        result = await db.execute(
+            select(Products.id, Products.prod_type).where(Products.id.in_(missing))
+        )
+        for product_id, prod_type in result:
+            product_type_cache.set(product_id, prod_type)
+            types[product_id] = prod_type
+    return set(types.values())
+
+
+class Subscription:
+    __slots__ = ("websocket", "stream", "filters", "field")
+
+    def __init__(self, websocket: WebSocket, stream: OrderStream, filters: dict[str, frozenset]):
+        self.websocket = websocket
+        self.stream = stream
+        self.filters = filters
+        # The filter this subscription is indexed under; None = everything
+        self.field = next((f for f in FILTER_FIELDS if f in filters), None)
+
+    def matches(self, keys: dict[str, Iterable]) -> bool:
+        for field, wanted in self.filters.items():
+            if field != self.field and wanted.isdisjoint(keys.get(field, ())):
+                return False
+        return True
+
+
+class SubscriptionRouter:
+    def __init__(self):
+        self.everything: dict[WebSocket, Subscription] = {}
+        self.index: dict[str, dict[object, set[Subscription]]] = {f: {} for f in FILTER_FIELDS}
+        self.by_socket: dict[WebSocket, Subscription] = {}
+
+    def subscribe(
+        self,
+        websocket: WebSocket,
+        stream: OrderStream,
+        filters: dict[str, Iterable] | None = None,
+    ) -> Subscription:
+        """Add the socket, replacing any filters it had."""
+        self.unsubscribe(websocket)
+        clean = {
+            field: frozenset(values)
+            for field, values in (filters or {}).items()
+            if values
+        }
+        subscription = Subscription(websocket, stream, clean)
+        self.by_socket[websocket] = subscription
+        if subscription.field is None:
+            self.everything[websocket] = subscription
+        else:
+            index = self.index[subscription.field]
+            for value in clean[subscription.field]:
+                index.setdefault(value, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, websocket: WebSocket) -> None:
+        subscription = self.by_socket.pop(websocket, None)
+        if subscription is None:
+            return
+        if subscription.field is None:
+            del self.everything[websocket]
+            return
+        index = self.index[subscription.field]
+        for value in subscription.filters[subscription.field]:
+            subscribers = index[value]
+            subscribers.discard(subscription)
+            if not subscribers:
+                del index[value]
+
+    def match(self, keys: dict[str, Iterable]) -> list[Subscription]:
+        """Subscriptions that want an event with these filter values."""
+        matched = list(self.everything.values())
+        seen = set()
+        for field in FILTER_FIELDS:
+            index = self.index[field]
+            if not index:
+                continue
+            for value in keys.get(field, ()):
+                for subscription in index.get(value, ()):
+                    if subscription not in seen and subscription.matches(keys):
+                        seen.add(subscription)
+                        matched.append(subscription)
+        return matched
+
+    def __len__(self) -> int:
+        return len(self.by_socket)
+
+    def __contains__(self, websocket: WebSocket) -> bool:
+        return websocket in self.by_socket
@@ -0,0 +1,123 @@
+"""
+Per-user status events for buyers that can't keep a WebSocket open.
+
+broadcast_to_user() publishes every status_changed message here before it
+goes to the user's sockets. Each user's last USER_EVENTS_HISTORY events are
+kept for USER_EVENTS_TTL seconds, so clients can resume:
+
+    GET /order/events/{user_id}   Server-Sent Events; resumes from the
+                                  Last-Event-ID header
+    GET /order/poll/{user_id}     long poll; ?after=<last_event_id>
+
+A waiting client costs one future (long poll) or one suspended generator
+(SSE), not a WebSocket. Event ids start from the boot time in milliseconds,
+so ids from before a restart are always older than new ones. Ids are per
+process; with several workers a client must stay on one of them.
+"""
+import asyncio
+from collections import deque
+from os import getenv
+from time import time
+from typing import AsyncIterator
+
+import orjson
+
+from app.cache import TTLCache
+from app.metrics import registry
+
+USER_EVENTS_HISTORY = int(getenv("USER_EVENTS_HISTORY", "20"))
+USER_EVENTS_TTL = float(getenv("USER_EVENTS_TTL", "3600"))
+USER_EVENTS_MAX_USERS = int(getenv("USER_EVENTS_MAX_USERS", "50000"))
+SSE_KEEPALIVE = float(getenv("SSE_KEEPALIVE", "15"))
+SSE_RETRY_MS = int(getenv("SSE_RETRY_MS", "3000"))
+LONG_POLL_TIMEOUT = float(getenv("LONG_POLL_TIMEOUT", "25"))
+
+
+class UserEventFeed:
+    def __init__(self, history: int, ttl: float, max_users: int):
+        self.history = history
+        self.last_id = int(time() * 1000)
+        # user_id -> deque of (event_id, message)
+        self.events = TTLCache(maxsize=max_users, ttl=ttl)
+        self.waiters: dict[int, set[asyncio.Future]] = {}
+        self.streams = 0
+
+    def publish(self, user_id: int, message: dict) -> int:
+        self.last_id += 1
+        events = self.events.get(user_id)
+        if events is None:
+            events = deque(maxlen=self.history)
+        events.append((self.last_id, message))
+        self.events.set(user_id, events)
+
+        for waiter in self.waiters.pop(user_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+        return self.last_id
+
+    def since(self, user_id: int, after: int) -> tuple[list[tuple[int, dict]], bool]:
+        """Events newer than `after`, and whether older ones were dropped."""
+        events = self.events.get(user_id)
+        if not events:
+            return [], False
+        newer = [event for event in events if event[0] > after]
+        # A full buffer that starts after `after` may have lost events in between
+        return newer, len(events) == events.maxlen and events[0][0] > after
+
+    async def wait(self, user_id: int, after: int, timeout: float) -> tuple[list[tuple[int, dict]], bool]:
+        """Return newer events, parking until one is published or `timeout` passes."""
+        events, truncated = self.since(user_id, after)
+        if events:
+            return events, truncated
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(user_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return [], False
+        finally:
+            waiting = self.waiters.get(user_id)
+            if waiting is not None:
+                waiting.discard(waiter)
+                if not waiting:
+                    del self.waiters[user_id]
+        return self.since(user_id, after)
+
+
+user_events = UserEventFeed(USER_EVENTS_HISTORY, USER_EVENTS_TTL, USER_EVENTS_MAX_USERS)
+
+RESYNC = {"type": "resync"}
+
+
+def _sse(event_id: int | None, message: dict) -> bytes:
+    head = b"id: %d\n" % event_id if event_id is not None else b""
+    return head + b"data: " + orjson.dumps(message) + b"\n\n"
+
+
+async def sse_stream(user_id: int, last_event_id: int | None) -> AsyncIterator[bytes]:
+    """SSE body; resync tells the client to refetch /order/{user_id}."""
+    user_events.streams += 1
+    try:
+        after = user_events.last_id if last_event_id is None else last_event_id
+        yield b"retry: %d\n\n" % SSE_RETRY_MS
+        while True:
+            events, truncated = await user_events.wait(user_id, after, SSE_KEEPALIVE)
+            if not events:
+                yield b": keepalive\n\n"
+                continue
+            if truncated:
+                yield _sse(None, RESYNC)
+            for event_id, message in events:
+                yield _sse(event_id, message)
+            after = events[-1][0]
+    finally:
+        user_events.streams -= 1
+
+
+registry.gauge("sse_streams", "Open /order/events streams", lambda: user_events.streams)
+registry.gauge(
+    "long_poll_waiters",
+    "Requests parked waiting for a user event (SSE and long poll)",
+    lambda: sum(len(w) for w in user_events.waiters.values()),
+)
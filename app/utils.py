@@ -1,7 +1,13 @@
-from os import getenv
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os import cpu_count, getenv
 from datetime import datetime, timedelta
+from typing import Any, Callable
+from uuid import uuid4
 from jose import jwt
 from passlib.context import CryptContext
+from .cache import TTLCache
 
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 30 minutes
@@ -10,24 +16,147 @@ ALGORITHM = "HS256"
 JWT_SECRET_KEY = getenv("JWT_SECRET_KEY", "secret")
 JWT_REFRESH_SECRET_KEY = getenv("JWT_REFRESH_SECRET_KEY", "secret")
 
+# bcrypt cost factor; pick it with `python -m app.calibrate_bcrypt`.
+# Stored hashes with a different cost are rehashed on the next login.
+BCRYPT_ROUNDS = int(getenv("BCRYPT_ROUNDS", "12"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on a dedicated pool so it never blocks the event loop
+HASH_POOL_WORKERS = int(getenv("HASH_POOL_WORKERS", "4"))
+HASH_POOL_MAX_QUEUE = int(getenv("HASH_POOL_MAX_QUEUE", "64"))
+# Separate process pool for bulk onboarding so it never starves logins
+BULK_HASH_WORKERS = int(getenv("BULK_HASH_WORKERS", str(cpu_count() or 1)))
+
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password, hashed_password):
+    """Return (is_valid, new_hash); new_hash is None unless a rehash is due."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+
+class HashPoolSaturated(Exception):
+    """Raised when the hashing pool already has max_queue jobs waiting."""
+
+
+class PasswordHashPool:
+    """Bounded thread pool for bcrypt work.
+
+    bcrypt releases the GIL, so threads give real parallelism here. Jobs beyond
+    `max_workers` wait in the executor queue; once `max_queue` jobs are waiting
+    new ones are rejected with HashPoolSaturated instead of piling up.
+    The counters are only touched from the event loop thread.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bcrypt"
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HashPoolSaturated()
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+hash_pool = PasswordHashPool(HASH_POOL_WORKERS, HASH_POOL_MAX_QUEUE)
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await hash_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password, hashed_password
+) -> tuple[bool, str | None]:
+    return await hash_pool.run(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password) -> str:
+    return await hash_pool.run(get_password_hash, password)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+_bulk_hash_executor: ProcessPoolExecutor | None = None
+
+
+async def hash_passwords_parallel(passwords: list[str]) -> list[str]:
+    """Hash many passwords across BULK_HASH_WORKERS processes, order preserved."""
+    global _bulk_hash_executor
+    if not passwords:
+        return []
+    if _bulk_hash_executor is None:
+        # spawn, not fork: the parent already runs the event loop and hash threads
+        _bulk_hash_executor = ProcessPoolExecutor(
+            max_workers=BULK_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    size = -(-len(passwords) // BULK_HASH_WORKERS)
+    chunks = [passwords[i : i + size] for i in range(0, len(passwords), size)]
+    loop = asyncio.get_running_loop()
+    hashed = await asyncio.gather(
+        *(
+            loop.run_in_executor(_bulk_hash_executor, hash_passwords, chunk)
+            for chunk in chunks
+        )
+    )
+    return [h for chunk in hashed for h in chunk]
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -37,7 +166,15 @@ def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+        expire = datetime.utcnow() + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "jti": uuid4().hex, "type": "refresh"})
     encoded_jwt = jwt.encode(to_encode, JWT_REFRESH_SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+# Refresh-token jti's that were already used or revoked. The revoked_tokens
+# table is the source of truth; this only short-circuits replays locally.
+revoked_refresh_tokens = TTLCache(
+    maxsize=int(getenv("REVOKED_TOKEN_CACHE_SIZE", "100000")),
+    ttl=REFRESH_TOKEN_EXPIRE_MINUTES * 60,
+)
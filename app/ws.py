@@ -0,0 +1,235 @@
+"""
+WebSocket admission, heartbeats and idle reaping for the /order sockets.
+
+Every socket goes through ws_connections.accept(), which enforces a global
+cap (WS_MAX_CONNECTIONS), a per-user cap (WS_MAX_PER_USER) and an accept
+rate (WS_ACCEPT_RATE/s, bursts of WS_ACCEPT_BURST). The per-user cap only
+counts sockets that presented a valid access token, keyed on its principal:
+a path parameter would let anyone use up someone else's sockets. A refused client gets
+{"type": "retry", "retry_after": seconds} and a 1013 close; the delay is
+jittered so a Wi-Fi blip doesn't turn into a reconnect storm.
+
+While the app runs, one sweeper task sends {"type": "ping"} to every socket
+each WS_PING_INTERVAL seconds and closes sockets that haven't sent anything
+(a pong, a ping, any message) for WS_IDLE_TIMEOUT seconds. Pings go out
+WS_SWEEP_CONCURRENCY at a time, so stalled clients hold a sweep up by a
+couple of WS_SEND_TIMEOUTs per chunk, not per stalled socket.
+"""
+import asyncio
+import logging
+import random
+from os import getenv
+from time import monotonic
+
+from fastapi import WebSocket
+import orjson
+
+from app.metrics import Counter, registry
+
+logger = logging.getLogger("app.ws")
+
+WS_PING_INTERVAL = float(getenv("WS_PING_INTERVAL", "20"))
+WS_IDLE_TIMEOUT = float(getenv("WS_IDLE_TIMEOUT", "90"))
+WS_SEND_TIMEOUT = float(getenv("WS_SEND_TIMEOUT", "5"))
+# Pings in flight at once during a sweep
+WS_SWEEP_CONCURRENCY = int(getenv("WS_SWEEP_CONCURRENCY", "500"))
+WS_MAX_CONNECTIONS = int(getenv("WS_MAX_CONNECTIONS", "5000"))
+WS_MAX_PER_USER = int(getenv("WS_MAX_PER_USER", "5"))
+WS_ACCEPT_RATE = float(getenv("WS_ACCEPT_RATE", "100"))
+WS_ACCEPT_BURST = int(getenv("WS_ACCEPT_BURST", "200"))
+WS_RETRY_AFTER_MIN = float(getenv("WS_RETRY_AFTER_MIN", "1"))
+WS_RETRY_AFTER_MAX = float(getenv("WS_RETRY_AFTER_MAX", "10"))
+
+# RFC 6455: 1001 going away, 1013 try again later
+CLOSE_IDLE = 1001
+CLOSE_TRY_AGAIN = 1013
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0, or how many seconds until one is available."""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def retry_after(at_least: float = 0.0) -> float:
+    """Jittered reconnect delay, so refused clients don't come back together."""
+    low = max(WS_RETRY_AFTER_MIN, at_least)
+    high = max(WS_RETRY_AFTER_MAX, low)
+    return round(random.uniform(low, high), 1)
+
+
+async def send_message(websocket: WebSocket, message: dict, binary: bool = False) -> None:
+    """Send a JSON message in the socket's negotiated frame type."""
+    payload = orjson.dumps(message)
+    if binary:
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_text(payload.decode())
+
+
+class Connection:
+    __slots__ = ("principal", "last_seen", "binary")
+
+    def __init__(self, principal: str | None, binary: bool = False):
+        self.principal = principal
+        self.last_seen = monotonic()
+        self.binary = binary
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        max_connections: int,
+        max_per_user: int,
+        accept_rate: float,
+        accept_burst: int,
+        ping_interval: float,
+        idle_timeout: float,
+    ):
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.bucket = TokenBucket(accept_rate, accept_burst)
+        self.connections: dict[WebSocket, Connection] = {}
+        # authenticated principal -> open sockets
+        self.per_user: dict[str, int] = {}
+        self._task: asyncio.Task | None = None
+
+    def _refusal(self, principal: str | None) -> tuple[str, float] | None:
+        if len(self.connections) >= self.max_connections:
+            return "server_full", 0.0
+        if principal is not None and self.per_user.get(principal, 0) >= self.max_per_user:
+            return "too_many_user_connections", 0.0
+        wait = self.bucket.take()
+        if wait:
+            return "rate_limited", wait
+        return None
+
+    async def accept(
+        self,
+        websocket: WebSocket,
+        principal: str | None = None,
+        subprotocol: str | None = None,
+        binary: bool = False,
+    ) -> bool:
+        """Accept and register the socket, or tell the client when to retry.
+
+        `principal`: from a verified token, never from the request path or body.
+        `binary`: the subprotocol uses binary frames, for control messages too.
+        """
+        refusal = self._refusal(principal)
+        await websocket.accept(subprotocol=subprotocol)
+        if refusal is not None:
+            reason, wait = refusal
+            delay = retry_after(wait)
+            REJECTED_TOTAL.inc(reason)
+            try:
+                await send_message(
+                    websocket, {"type": "retry", "reason": reason, "retry_after": delay}, binary
+                )
+                await websocket.close(code=CLOSE_TRY_AGAIN, reason=f"retry after {delay}s")
+            except Exception:
+                pass
+            return False
+
+        self.connections[websocket] = Connection(principal, binary)
+        if principal is not None:
+            self.per_user[principal] = self.per_user.get(principal, 0) + 1
+        return True
+
+    def touch(self, websocket: WebSocket) -> None:
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = monotonic()
+
+    def discard(self, websocket: WebSocket) -> None:
+        connection = self.connections.pop(websocket, None)
+        if connection is None or connection.principal is None:
+            return
+        left = self.per_user[connection.principal] - 1
+        if left:
+            self.per_user[connection.principal] = left
+        else:
+            del self.per_user[connection.principal]
+
+    async def _close(self, websocket: WebSocket, code: int, reason: str) -> None:
+        self.discard(websocket)
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _ping(self, websocket: WebSocket, connection: Connection, idle_before: float) -> None:
+        if connection.last_seen < idle_before:
+            REAPED_TOTAL.inc()
+            await self._close(websocket, CLOSE_IDLE, "idle timeout")
+            return
+        try:
+            await asyncio.wait_for(
+                send_message(websocket, {"type": "ping"}, connection.binary), WS_SEND_TIMEOUT
+            )
+        except Exception:
+            REAPED_TOTAL.inc()
+            await self._close(websocket, CLOSE_IDLE, "send failed")
+
+    async def sweep(self) -> None:
+        """Ping live sockets and close the ones that have gone quiet."""
+        idle_before = monotonic() - self.idle_timeout
+        connections = list(self.connections.items())
+        for start in range(0, len(connections), WS_SWEEP_CONCURRENCY):
+            await asyncio.gather(*(
+                self._ping(websocket, connection, idle_before)
+                for websocket, connection in connections[start : start + WS_SWEEP_CONCURRENCY]
+            ))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("websocket sweep failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+ws_connections = ConnectionManager(
+    max_connections=WS_MAX_CONNECTIONS,
+    max_per_user=WS_MAX_PER_USER,
+    accept_rate=WS_ACCEPT_RATE,
+    accept_burst=WS_ACCEPT_BURST,
+    ping_interval=WS_PING_INTERVAL,
+    idle_timeout=WS_IDLE_TIMEOUT,
+)
+
+REJECTED_TOTAL = registry.register(
+    Counter("ws_rejected_total", "WebSocket connections refused at accept", ("reason",))
+)
+REAPED_TOTAL = registry.register(
+    Counter("ws_reaped_total", "WebSocket connections closed for idling or failed pings")
+)
+registry.gauge("ws_connections", "Open WebSocket connections", lambda: len(ws_connections.connections))
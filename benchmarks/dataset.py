@@ -0,0 +1,219 @@
+"""
+Synthetic dataset generator for realistic-scale benchmarks and query plans.
+
+    python -m benchmarks.dataset --url sqlite+aiosqlite:///./bench.db --orders 1000000
+    python -m benchmarks.dataset --users 20000 --products 500 --status-mix paid=0.9,cancelled=0.1
+
+Fills the app.db.models tables with bulk inserts into an empty database (or
+one emptied with --reset). The same --seed and --end give the same rows. Order volume per user and product popularity follow Zipf-like
+weights (--user-skew, --product-skew; 0 is uniform). Timestamps spread over
+the --days before --end with a lunch-time peak. Every user can log in with --password.
+Generated order codes are "g" + base-36 id, so they never collide with the
+three-digit codes the API hands out.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+import orjson
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.db.models import Order, Products, Users
+from app.db.sessions import Base, build_async_engine
+
+DEFAULT_STATUS_MIX = "paid=0.8,cancelled=0.07,pending=0.08,ready=0.05"
+# Relative order volume per hour of day
+HOURLY_WEIGHTS = [0, 0, 0, 0, 0, 0, 1, 4, 8, 5, 4, 12, 30, 28, 10, 4, 5, 6, 3, 1, 0, 0, 0, 0]
+PRODUCT_TYPES = ["food", "drink", "dessert"]
+BATCH_SIZE = 20_000
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(Order.status.type.enums)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown statuses: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def zipf_weights(n: int, skew: float) -> list[float]:
+    """Cumulative weights for random.choices; rank 1 is the most popular."""
+    return list(accumulate(1 / rank**skew for rank in range(1, n + 1)))
+
+
+def base36(n: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+
+def user_rows(args, password_hash: str) -> list[dict]:
+    return [
+        {"id": i, "email": f"user{i}@example.com", "name": f"User {i}", "password": password_hash}
+        for i in range(1, args.users + 1)
+    ]
+
+
+def product_rows(args, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "id": i,
+            "name": f"Product {i}",
+            "price": rng.randrange(200, 3000, 10),
+            "quantity": rng.randint(0, 500),
+            "prod_type": rng.choice(PRODUCT_TYPES),
+        }
+        for i in range(1, args.products + 1)
+    ]
+
+
+def order_batches(args, rng: random.Random, products: list[dict]):
+    """Yield lists of order rows, BATCH_SIZE at a time.
+
+    Draws are made a batch at a time; one random.choices call per column is
+    several times faster than one per row.
+    """
+    user_ids = list(range(1, args.users + 1))
+    rng.shuffle(user_ids)  # heavy users aren't just the lowest ids
+    user_cum = zipf_weights(args.users, args.user_skew)
+    product_ids = list(range(1, args.products + 1))
+    rng.shuffle(product_ids)
+    product_cum = zipf_weights(args.products, args.product_skew)
+    statuses = list(args.status_mix)
+    status_cum = list(accumulate(args.status_mix.values()))
+    hour_cum = list(accumulate(HOURLY_WEIGHTS))
+    max_items, max_qty, days = args.max_items, args.max_quantity, args.days
+    start = datetime.combine(args.end, datetime.min.time()) - timedelta(days=days)
+    random_ = rng.random
+
+    for first in range(1, args.orders + 1, BATCH_SIZE):
+        n = min(BATCH_SIZE, args.orders + 1 - first)
+        users = rng.choices(user_ids, cum_weights=user_cum, k=n)
+        picks = rng.choices(product_ids, cum_weights=product_cum, k=n * max_items)
+        order_statuses = rng.choices(statuses, cum_weights=status_cum, k=n)
+        hours = rng.choices(range(24), cum_weights=hour_cum, k=n)
+        batch = []
+        for i in range(n):
+            order_id = first + i
+            user_id = users[i]
+            status = order_statuses[i]
+            count = int(random_() * max_items) + 1
+            items = []
+            price = 0
+            for product_id in dict.fromkeys(picks[i * max_items:i * max_items + count]):
+                product = products[product_id - 1]
+                quantity = int(random_() * max_qty) + 1
+                price += product["price"] * quantity
+                items.append({"product_id": product_id, "name": product["name"],
+                              "quantity": quantity, "price": product["price"]})
+            offset = int(random_() * days) * 86400 + hours[i] * 3600 + int(random_() * 3600)
+            batch.append({
+                "id": order_id,
+                "user_id": user_id,
+                "user_name": f"User {user_id}",
+                "items": items,
+                "comment": None if random_() < 0.8 else "no onions",
+                "timestamp": start + timedelta(seconds=offset),
+                "code": "g" + base36(order_id),
+                "price": price,
+                "is_active": status in ("pending", "ready"),
+                "status": status,
+            })
+        yield batch
+
+
+ORDER_COLUMNS = ("id", "user_id", "user_name", "items", "comment", "timestamp",
+                 "code", "price", "is_active", "status")
+
+
+async def insert_orders(conn: AsyncConnection, batch: list[dict]) -> None:
+    if conn.dialect.name != "sqlite":
+        await conn.execute(insert(Order), batch)
+        return
+    # Core spends ~2/3 of the load time in per-row JSON/DateTime bind
+    # processing on SQLite; pre-serialising and going straight to the
+    # driver keeps a million orders well under a minute.
+    rows = [
+        (r["id"], r["user_id"], r["user_name"], orjson.dumps(r["items"]).decode(),
+         r["comment"], r["timestamp"].isoformat(" "), r["code"], r["price"],
+         r["is_active"], r["status"])
+        for r in batch
+    ]
+    await conn.exec_driver_sql(
+        f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(ORDER_COLUMNS))})",
+        rows,
+    )
+
+
+async def generate(engine: AsyncEngine, args) -> None:
+    from app.utils import get_password_hash
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        if args.reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        if await conn.scalar(select(func.count()).select_from(Users)):
+            raise SystemExit("database already has users; pass --reset to replace them")
+        if engine.dialect.name == "sqlite":
+            # Bulk load only; the database is fsynced by the commit anyway
+            await conn.exec_driver_sql("PRAGMA synchronous=OFF")
+
+        await conn.execute(insert(Users), user_rows(args, get_password_hash(args.password)))
+        products = product_rows(args, rng)
+        await conn.execute(insert(Products), products)
+        print(f"users={args.users} products={args.products}")
+
+        done = 0
+        for batch in order_batches(args, rng, products):
+            await insert_orders(conn, batch)
+            done += len(batch)
+            print(f"\rorders={done} ({time.perf_counter() - started:.1f}s)", end="", flush=True)
+
+        if engine.dialect.name == "postgresql":
+            # Explicit ids don't advance the sequences
+            for table in ("users", "products", "orders"):
+                await conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT max(id) FROM {table}))"
+                )
+    await engine.dispose()
+    print(f"\ndone in {time.perf_counter() - started:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="sqlite+aiosqlite:///./dataset.db")
+    parser.add_argument("--reset", action="store_true", help="drop existing tables first")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--status-mix", type=parse_mix, default=parse_mix(DEFAULT_STATUS_MIX))
+    parser.add_argument("--user-skew", type=float, default=0.8)
+    parser.add_argument("--product-skew", type=float, default=1.2)
+    parser.add_argument("--max-items", type=int, default=4, help="distinct products per order")
+    parser.add_argument("--max-quantity", type=int, default=3)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(),
+                        help="last day of the order history, YYYY-MM-DD")
+    parser.add_argument("--password", default="password")
+    args = parser.parse_args()
+    asyncio.run(generate(build_async_engine(args.url), args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Event-loop latency while 100 logins run concurrently.
+
+    python -m benchmarks.login_event_loop [--logins 100] [--inline]
+
+`--inline` runs bcrypt directly on the event loop (the old behaviour) so the
+two numbers can be compared side by side. With the default pool size
+(4 workers + 64 queued) some of the 100 logins are rejected with 503, which
+is the intended shedding behaviour.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="canteen-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp}/bench.db")
+# Measure bcrypt on the loop, not the per-IP login limit
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from app import utils  # noqa: E402
+from app.app import create_app  # noqa: E402
+from app.db.sessions import Base, async_engine  # noqa: E402
+
+
+class InlinePool(utils.PasswordHashPool):
+    async def run(self, fn, *args):
+        return fn(*args)
+
+
+async def sample_lag(stop: asyncio.Event, interval: float, out: list[float]):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        out.append((loop.time() - start - interval) * 1000)
+
+
+async def main(logins: int, inline: bool) -> None:
+    if inline:
+        utils.hash_pool = InlinePool(1, 0)
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    app = create_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post(
+            "/auth/register/",
+            json={"email": "bench@example.com", "name": "bench", "password": "string"},
+        )
+
+        lags: list[float] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_lag(stop, 0.005, lags))
+
+        started = time.perf_counter()
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    "/auth/login/",
+                    json={"email": "bench@example.com", "password": "string"},
+                )
+                for _ in range(logins)
+            )
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+    codes: dict[int, int] = {}
+    for r in responses:
+        codes[r.status_code] = codes.get(r.status_code, 0) + 1
+
+    p99 = statistics.quantiles(lags, n=100)[98] if len(lags) > 1 else lags[0]
+    print(f"mode:            {'inline' if inline else 'pool'}")
+    print(f"logins:          {logins} in {elapsed:.2f}s -> {codes}")
+    print(f"loop lag mean:   {statistics.mean(lags):.1f} ms")
+    print(f"loop lag p99:    {p99:.1f} ms")
+    print(f"loop lag max:    {max(lags):.1f} ms")
+    print(f"pool stats:      {utils.hash_pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--inline", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.inline))
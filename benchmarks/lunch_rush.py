@@ -0,0 +1,355 @@
+"""
+Lunch-rush load and WebSocket scale benchmark.
+
+    python -m benchmarks.lunch_rush [--buyers 200] [--kitchen-sockets 1000] [--seconds 30]
+    python -m benchmarks.lunch_rush --url http://127.0.0.1:8000 ...
+    python -m benchmarks.lunch_rush --compare results/a.json results/b.json
+
+By default it seeds a fresh SQLite database and starts uvicorn on it in a
+subprocess. With --url it targets a running server instead; that database
+must already hold users 1..--buyers and products 1..--products with enough
+stock, as seed() below creates them.
+
+Simulated traffic:
+  * every buyer holds a socket on /order/ws/updates/{user_id} and places
+    orders with exponential think time (--order-interval)
+  * --kitchen-sockets clients listen on /order/ws
+  * --kitchen-workers mark each new order "ready" and later "paid"
+  * --pollers fetch /products/ and /order/all every --poll-interval
+
+Order codes are three digits 1-9 and unique across the orders table, so one
+database holds at most 729 orders; keep buyers * seconds / order-interval
+well below that.
+
+Reported: HTTP throughput and p50/p95/p99 per operation, plus fan-out delay,
+which is the time from sending POST /order/create (or PATCH) to the matching
+event arriving on each socket. Events are broadcast by the outbox dispatcher
+(app.outbox), so the delay includes its wake-up after the commit. Results are saved to results/ as JSON,
+tagged with the current git commit.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+import websockets
+
+PONG = json.dumps({"action": "pong"})
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, ms: float) -> None:
+        self.latencies[name].append(ms)
+
+    def summary(self, seconds: float) -> dict:
+        out = {}
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            q = statistics.quantiles(values, n=100, method="inclusive") if len(values) > 1 else values * 99
+            out[name] = {
+                "count": len(values),
+                "per_sec": round(len(values) / seconds, 2),
+                "p50_ms": round(q[49], 2),
+                "p95_ms": round(q[94], 2),
+                "p99_ms": round(q[98], 2),
+                "max_ms": round(values[-1], 2),
+                "errors": self.errors.get(name, 0),
+            }
+        for name, count in self.errors.items():
+            out.setdefault(name, {"count": 0, "errors": count})
+        return out
+
+
+# ------------------------------------------------------------
+#  Server under test
+# ------------------------------------------------------------
+def seed(database_url: str, buyers: int, products: int) -> None:
+    os.environ["DATABASE_URL"] = database_url
+    from sqlalchemy import insert
+
+    from app.db.models import Products, Users
+    from app.db.sessions import Base, async_engine
+
+    async def run():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(
+                insert(Users),
+                [{"email": f"buyer{i}@example.com", "name": f"Buyer {i}", "password": "x"}
+                 for i in range(1, buyers + 1)],
+            )
+            await conn.execute(
+                insert(Products),
+                [{"name": f"Dish {i}", "price": 500 + 10 * i, "quantity": 10**9,
+                  "prod_type": random.choice(["food", "drink", "dessert"])}
+                 for i in range(1, products + 1)],
+            )
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def start_server(database_url: str, port: int) -> subprocess.Popen:
+    # Measure fan-out, not admission control: every socket connects at once,
+    # and every buyer orders from 127.0.0.1, far over the per-IP order limit
+    env = {**os.environ, "DATABASE_URL": database_url,
+           "WS_ACCEPT_BURST": "1000000", "WS_MAX_CONNECTIONS": "1000000",
+           "RATE_LIMIT_ENABLED": "false"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--log-level", "warning", "--ws-max-queue", "256"],
+        env=env,
+    )
+
+
+async def wait_until_up(url: str) -> None:
+    async with httpx.AsyncClient(base_url=url) as client:
+        for _ in range(100):
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise SystemExit(f"server at {url} did not come up")
+
+
+# ------------------------------------------------------------
+#  Simulated clients
+# ------------------------------------------------------------
+class Run:
+    def __init__(self, args):
+        self.args = args
+        self.rec = Recorder()
+        self.stop = asyncio.Event()
+        # order code / (order id, status) -> time the triggering request was sent
+        self.created_at: dict[str, float] = {}
+        self.status_at: dict[tuple[int, str], float] = {}
+        # order_created events that arrived before the create response
+        self.early: dict[str, list[float]] = defaultdict(list)
+        self.new_orders: asyncio.Queue = asyncio.Queue()
+        self.connected = 0
+
+    async def timed(self, name: str, coro):
+        start = time.perf_counter()
+        try:
+            rv = await coro
+        except httpx.HTTPError:
+            self.rec.errors[name] += 1
+            return None
+        self.rec.add(name, (time.perf_counter() - start) * 1000)
+        if rv.status_code >= 400:
+            self.rec.errors[name] += 1
+            return None
+        return rv
+
+    async def kitchen_socket(self, ws_url: str) -> None:
+        try:
+            async with websockets.connect(f"{ws_url}/order/ws", max_queue=None) as ws:
+                self.connected += 1
+                while not self.stop.is_set():
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    message = json.loads(raw)
+                    if message.get("type") == "ping":
+                        await ws.send(PONG)
+                        continue
+                    if message.get("type") != "order_created":
+                        continue
+                    code = message["data"]["code"]
+                    sent = self.created_at.get(code)
+                    if sent is None:
+                        self.early[code].append(time.perf_counter())
+                    else:
+                        self.rec.add("fanout_order_created", (time.perf_counter() - sent) * 1000)
+        except (OSError, websockets.WebSocketException):
+            self.rec.errors["kitchen_socket"] += 1
+
+    async def buyer(self, client: httpx.AsyncClient, ws_url: str, user_id: int) -> None:
+        try:
+            async with websockets.connect(f"{ws_url}/order/ws/updates/{user_id}") as ws:
+                self.connected += 1
+                listener = asyncio.create_task(self.buyer_updates(ws))
+                while not self.stop.is_set():
+                    await asyncio.sleep(random.expovariate(1 / self.args.order_interval))
+                    if self.stop.is_set():
+                        break
+                    await self.place_order(client, user_id)
+                listener.cancel()
+        except (OSError, websockets.WebSocketException):
+            self.rec.errors["buyer_socket"] += 1
+
+    async def buyer_updates(self, ws) -> None:
+        async for raw in ws:
+            message = json.loads(raw)
+            if message.get("type") == "ping":
+                await ws.send(PONG)
+                continue
+            if message.get("type") != "status_changed":
+                continue
+            sent = self.status_at.pop((message["order_id"], message["status"]), None)
+            if sent is not None:
+                self.rec.add("fanout_status_changed", (time.perf_counter() - sent) * 1000)
+
+    async def place_order(self, client: httpx.AsyncClient, user_id: int) -> None:
+        items = []
+        for product_id in random.sample(range(1, self.args.products + 1), k=random.randint(1, 3)):
+            items.append({"product_id": product_id, "name": f"Dish {product_id}",
+                          "quantity": random.randint(1, 2), "price": 500})
+        payload = {"user_id": user_id, "items": items, "comment": "",
+                   "price": sum(i["price"] * i["quantity"] for i in items)}
+        sent = time.perf_counter()
+        rv = await self.timed("create_order", client.post("/order/create", json=payload))
+        if rv is not None:
+            order = rv.json()
+            self.created_at[order["code"]] = sent
+            # Broadcasts go through the outbox after the commit, so the event
+            # usually arrives after the response; the ones that beat it were
+            # parked in self.early
+            for received in self.early.pop(order["code"], []):
+                self.rec.add("fanout_order_created", (received - sent) * 1000)
+            await self.new_orders.put(order["id"])
+
+    async def kitchen_worker(self, client: httpx.AsyncClient) -> None:
+        while not self.stop.is_set():
+            try:
+                order_id = await asyncio.wait_for(self.new_orders.get(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            for new_status in ("ready", "paid"):
+                await asyncio.sleep(random.uniform(0, self.args.prep_time))
+                self.status_at[(order_id, new_status)] = time.perf_counter()
+                await self.timed(
+                    "update_status",
+                    client.patch(f"/order/{order_id}", json={"status": new_status}),
+                )
+
+    async def poller(self, client: httpx.AsyncClient) -> None:
+        while not self.stop.is_set():
+            await self.timed("get_products", client.get("/products/"))
+            await self.timed("get_open_orders", client.get("/order/all"))
+            await asyncio.sleep(self.args.poll_interval)
+
+
+async def run_load(args, url: str) -> dict:
+    ws_url = url.replace("http", "ws", 1)
+    run = Run(args)
+    limits = httpx.Limits(max_connections=args.http_connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        sockets = [asyncio.create_task(run.kitchen_socket(ws_url)) for _ in range(args.kitchen_sockets)]
+        while run.connected < args.kitchen_sockets and not all(t.done() for t in sockets):
+            await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        tasks = sockets + [
+            *(asyncio.create_task(run.buyer(client, ws_url, uid)) for uid in range(1, args.buyers + 1)),
+            *(asyncio.create_task(run.kitchen_worker(client)) for _ in range(args.kitchen_workers)),
+            *(asyncio.create_task(run.poller(client)) for _ in range(args.pollers)),
+        ]
+        await asyncio.sleep(args.seconds)
+        run.stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+
+    return {"seconds": round(elapsed, 2), "sockets": run.connected, "operations": run.rec.summary(elapsed)}
+
+
+# ------------------------------------------------------------
+#  Reporting
+# ------------------------------------------------------------
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result: dict) -> None:
+    print(f"commit {result['commit']}  {result['seconds']}s  sockets={result['sockets']}")
+    print(f"{'operation':<24} {'count':>7} {'/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5}")
+    for name, r in result["operations"].items():
+        print(f"{name:<24} {r['count']:>7} {r.get('per_sec', 0):>8} {r.get('p50_ms', '-'):>8} "
+              f"{r.get('p95_ms', '-'):>8} {r.get('p99_ms', '-'):>8} {r['errors']:>5}")
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'operation':<24} {'metric':<8} {'old':>9} {'new':>9} {'change':>8}")
+    for name, n in new["operations"].items():
+        o = old["operations"].get(name, {})
+        for metric in ("per_sec", "p50_ms", "p95_ms", "p99_ms"):
+            if metric in n and o.get(metric):
+                change = (n[metric] - o[metric]) / o[metric] * 100
+                print(f"{name:<24} {metric:<8} {o[metric]:>9} {n[metric]:>9} {change:>+7.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--kitchen-sockets", type=int, default=1000)
+    parser.add_argument("--kitchen-workers", type=int, default=4)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--order-interval", type=float, default=20.0, help="mean seconds between a buyer's orders")
+    parser.add_argument("--prep-time", type=float, default=2.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--http-connections", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--out", default="results")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    server = None
+    url = args.url
+    if url is None:
+        database_url = f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='canteen-rush-')}/rush.db"
+        seed(database_url, args.buyers, args.products)
+        server = start_server(database_url, args.port)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(wait_until_up(url))
+        result = asyncio.run(run_load(args, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    result = {"commit": git_commit(), "timestamp": time.time(), "config": vars(args), **result}
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"lunch_rush-{int(result['timestamp'])}-{result['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print_report(result)
+    print(f"\nsaved {path}")
+
+
+if __name__ == "__main__":
+    main()
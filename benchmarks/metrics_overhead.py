@@ -0,0 +1,52 @@
+"""
+Per-request cost of MetricsMiddleware.
+
+    python -m benchmarks.metrics_overhead [--iterations 100000]
+
+Drives a trivial ASGI app directly (no HTTP client in the way), with and
+without the middleware, and prints the difference per request.
+"""
+import argparse
+import asyncio
+import time
+
+from app.metrics import MetricsMiddleware
+
+
+class _Route:
+    path = "/bench"
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def measure(app, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await app({"type": "http", "method": "GET", "path": "/bench"}, receive, send)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main(iterations: int) -> None:
+    plain = await measure(endpoint, iterations)
+    wrapped = await measure(MetricsMiddleware(endpoint), iterations)
+    print(f"without metrics: {plain:6.2f} us/request")
+    print(f"with metrics:    {wrapped:6.2f} us/request")
+    print(f"overhead:        {wrapped - plain:6.2f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100_000)
+    asyncio.run(main(parser.parse_args().iterations))
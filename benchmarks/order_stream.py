@@ -0,0 +1,106 @@
+"""
+Bytes on the wire per /order/ws event, by protocol version and compression.
+
+    python -m benchmarks.order_stream [--orders 300] [--seed 1]
+
+Replays a kitchen session through app.order_stream: each order is created,
+goes to "ready", then to "paid" (or "cancelled"), which is three events per
+order on every kitchen socket. Frames are compressed the way
+permessage-deflate does it (raw deflate, one context per connection with
+context takeover, sync flush without the trailing 4 bytes). Server frame
+headers (2 or 4 bytes) are included.
+"""
+import argparse
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.order_stream import PROTOCOL_V2, OrderEvent, OrderStream, order_data
+
+MENU = [
+    ("Plov", 1200), ("Lagman", 1100), ("Manti", 900), ("Samsa", 350),
+    ("Shorpo", 800), ("Borscht", 700), ("Chicken cutlet", 650), ("Mashed potatoes", 300),
+    ("Greek salad", 550), ("Tea", 100), ("Compote", 150), ("Americano", 250),
+    ("Cheesecake", 450), ("Bread", 30),
+]
+COMMENTS = ["", "", "", "no onions", "extra sauce", "to go, please"]
+
+
+def session(orders: int, rng: random.Random) -> list[OrderEvent]:
+    """Events in the order a kitchen socket would see them."""
+    start = datetime(2024, 1, 1, 11, 55)
+    open_orders = []
+    events = []
+    for order_id in range(1, orders + 1):
+        items = [
+            {"product_id": MENU.index(dish) + 1, "name": dish[0],
+             "quantity": rng.randint(1, 2), "price": dish[1]}
+            for dish in rng.sample(MENU, rng.randint(1, 4))
+        ]
+        order = SimpleNamespace(
+            id=order_id, user_id=rng.randint(1, 2000), user_name=f"Student {rng.randint(1, 2000)}",
+            code="".join(rng.choice("123456789") for _ in range(3)),
+            items=items, price=sum(i["price"] * i["quantity"] for i in items),
+            comment=rng.choice(COMMENTS), status="pending",
+            timestamp=start + timedelta(seconds=order_id * 7),
+        )
+        events.append(OrderEvent("order_created", order_data(order)))
+        open_orders.append(order)
+        # The kitchen works a few orders behind the queue
+        while len(open_orders) > 5 or (order_id == orders and open_orders):
+            done = open_orders.pop(0)
+            for status in ("ready", "cancelled" if rng.random() < 0.05 else "paid"):
+                done.status = status
+                events.append(OrderEvent("order_update", order_data(done), changed=("status",)))
+    return events
+
+
+def frame_header(size: int) -> int:
+    return 2 if size < 126 else 4 if size < 65536 else 10
+
+
+def measure(events: list[OrderEvent], subprotocol: str | None, deflate: bool) -> tuple[int, float]:
+    stream = OrderStream(subprotocol)
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    total = 0
+    started = time.perf_counter()
+    for event in events:
+        # Fresh events, so encoding cost is counted once per event
+        payload = stream.frame(OrderEvent(event.type, event.data, event.changed))
+        if isinstance(payload, str):
+            # Text frames go out UTF-8 encoded
+            payload = payload.encode()
+        if deflate:
+            payload = (compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+        total += frame_header(len(payload)) + len(payload)
+    return total, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    events = session(args.orders, random.Random(args.seed))
+    print(f"{args.orders} orders, {len(events)} events per kitchen socket\n")
+    print(f"{'protocol':<22}{'bytes/event':>12}{'total KiB':>11}{'us/event':>10}{'vs v1':>9}")
+    baseline = None
+    for name, subprotocol, deflate in (
+        ("v1 (full JSON)", None, False),
+        ("v1 + deflate", None, True),
+        ("v2 (deltas)", PROTOCOL_V2, False),
+        ("v2 + deflate", PROTOCOL_V2, True),
+    ):
+        total, elapsed = measure(events, subprotocol, deflate)
+        baseline = baseline or total
+        print(
+            f"{name:<22}{total / len(events):>12.1f}{total / 1024:>11.1f}"
+            f"{elapsed / len(events) * 1e6:>10.2f}{total / baseline:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
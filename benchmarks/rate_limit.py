@@ -0,0 +1,62 @@
+"""
+Per-request cost of the login/order rate limits.
+
+    python -m benchmarks.rate_limit [--requests 200000] [--clients 5000]
+
+Times RateLimit.check() with an IP key and a user key (what POST
+/auth/login/ and POST /order/create pay per request) against each backend,
+with requests spread over --clients distinct clients. The shared backend
+lives on /dev/shm like it would in production, and its cost includes the
+hop to the thread pool.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from app import rate_limit
+from app.rate_limit import MemoryBackend, RateLimit, SQLiteBackend
+
+
+async def measure(backend, keys: list[tuple[str, str]]) -> tuple[float, int]:
+    rate_limit.backend = backend
+    limit = RateLimit("bench", "10/60")
+    limited = 0
+    started = time.perf_counter()
+    for ip, user in keys:
+        try:
+            await limit.check(ip, user)
+        except Exception:
+            limited += 1
+    return (time.perf_counter() - started) / len(keys), limited
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keys = [
+        (f"ip:10.0.{c // 256}.{c % 256}", f"user:{c}")
+        for c in (rng.randrange(args.clients) for _ in range(args.requests))
+    ]
+    shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=shm) as tmp:
+        backends = (
+            ("memory", MemoryBackend(max_keys=100_000)),
+            ("sqlite (shared)", SQLiteBackend(os.path.join(tmp, "limits.db"), max_keys=100_000)),
+        )
+        print(f"{args.requests} requests from {args.clients} clients, 2 keys each\n")
+        print(f"{'backend':<18}{'us/request':>12}{'limited':>10}")
+        for name, backend in backends:
+            per_request, limited = asyncio.run(measure(backend, keys))
+            print(f"{name:<18}{per_request * 1e6:>12.2f}{limited / len(keys):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Replay captured traffic (app/capture.py) and report per-route latency.
+
+    python -m benchmarks.replay captures/requests.jsonl* [--speedup 10]
+    python -m benchmarks.replay captures/*.jsonl* --url http://staging:8000
+
+Without --url the app is driven in-process through httpx's ASGI transport,
+against whatever DATABASE_URL points at, with rate limits off unless
+RATE_LIMIT_ENABLED is set. Requests keep their original
+relative timing divided by --speedup (0 sends them as fast as possible).
+Redacted fields come back as "***", so logins replay as failed logins,
+which cost the same bcrypt verify. Requests whose body wasn't captured
+(truncated, or not JSON, form or CSV) replay without one.
+
+Authorization is never captured, so authenticated routes would replay as
+401s. Pass credentials for the whole replay with --token, --login or
+--header:
+
+    python -m benchmarks.replay captures/*.jsonl* --login admin@example.com:secret
+    python -m benchmarks.replay captures/*.jsonl* --header "Authorization: Bearer ..."
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+import orjson
+from httpx import ASGITransport, AsyncClient
+
+
+def load(paths: list[str]) -> list[dict]:
+    records = []
+    for path in paths:
+        with open(path, "rb") as f:
+            records.extend(orjson.loads(line) for line in f if line.strip())
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def request_kwargs(record: dict) -> dict:
+    kwargs: dict = {"headers": record.get("headers", {})}
+    if "json" in record:
+        kwargs["content"] = orjson.dumps(record["json"])
+    elif "form" in record:
+        kwargs["content"] = urlencode(record["form"])
+    elif "body" in record:
+        kwargs["content"] = record["body"].encode()
+    return kwargs
+
+
+def percentile(values: list[float], q: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def replay(client: AsyncClient, records: list[dict], speedup: float) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def send(record: dict) -> None:
+        key = f"{record['method']} {record.get('route') or record['path']}"
+        url = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+        start = time.perf_counter()
+        rv = await client.request(record["method"], url, **request_kwargs(record))
+        latencies[key].append((time.perf_counter() - start) * 1000)
+        statuses[key][rv.status_code] += 1
+
+    tasks = []
+    origin = records[0]["ts"]
+    started = time.perf_counter()
+    for record in records:
+        if speedup > 0:
+            delay = (record["ts"] - origin) / speedup - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(record)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    report = {"requests": len(records), "seconds": round(elapsed, 3), "routes": {}}
+    for key, values in sorted(latencies.items()):
+        report["routes"][key] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(max(values), 2),
+            "status": dict(statuses[key]),
+        }
+    return report
+
+
+def extra_headers(args) -> dict[str, str]:
+    headers = {}
+    for header in args.header:
+        name, sep, value = header.partition(":")
+        if not sep:
+            raise SystemExit(f"--header {header!r} is not 'Name: value'")
+        headers[name.strip()] = value.strip()
+    if args.token:
+        headers["Authorization"] = f"Bearer {args.token}"
+    return headers
+
+
+async def login(client: AsyncClient, credentials: str) -> str:
+    email, sep, password = credentials.partition(":")
+    if not sep:
+        raise SystemExit("--login takes email:password")
+    rv = await client.post("/auth/login/", json={"email": email, "password": password})
+    if rv.status_code != 200:
+        raise SystemExit(f"--login failed: {rv.status_code} {rv.text}")
+    return rv.json()["access_token"]
+
+
+async def main(args) -> None:
+    records = load(args.files)
+    if not records:
+        raise SystemExit("no captured requests found")
+
+    # Client defaults: captured headers (never Authorization) don't override them
+    headers = extra_headers(args)
+    if args.url:
+        client = AsyncClient(base_url=args.url, timeout=60, headers=headers)
+    else:
+        # All replayed traffic comes from one client; the original came from many
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        from app.app import create_app
+
+        client = AsyncClient(
+            transport=ASGITransport(app=create_app()), base_url="http://replay", headers=headers
+        )
+
+    async with client:
+        if args.login:
+            client.headers["Authorization"] = f"Bearer {await login(client, args.login)}"
+        report = await replay(client, records, args.speedup)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{report['requests']} requests in {report['seconds']}s")
+    print(f"{'route':<40} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for key, r in report["routes"].items():
+        print(
+            f"{key:<40} {r['count']:>6} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+            f"{r['p99_ms']:>8} {r['max_ms']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--speedup", type=float, default=1.0)
+    parser.add_argument("--json", default=None, help="also write the report here")
+    parser.add_argument("--token", default=None, help="bearer token sent with every request")
+    parser.add_argument("--login", default=None, help="email:password to get a token before replaying")
+    parser.add_argument(
+        "--header", action="append", default=[], help="'Name: value' sent with every request"
+    )
+    asyncio.run(main(parser.parse_args()))
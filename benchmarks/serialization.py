@@ -0,0 +1,104 @@
+"""
+Throughput of /products/ and /order/all with 1,000 rows each.
+
+    python -m benchmarks.serialization [--rows 1000] [--requests 200]
+
+Compares the current handlers (column projection + orjson) with copies of
+the previous ones (ORM objects re-validated through response_model and
+encoded by the stdlib JSONResponse), mounted under /legacy on the same app.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="canteen-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp}/bench.db")
+
+from fastapi import APIRouter, Depends  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from app.app import create_app  # noqa: E402
+from app.db.models import Order as OrderModel, Products, Users  # noqa: E402
+from app.db.schemas.orders import Order  # noqa: E402
+from app.db.schemas.products import ProductBase  # noqa: E402
+from app.db.sessions import Base, async_engine  # noqa: E402
+from app.deps import get_read_session  # noqa: E402
+
+legacy = APIRouter(prefix="/legacy", default_response_class=JSONResponse)
+
+
+@legacy.get("/products/", response_model=list[ProductBase])
+async def legacy_products(db: AsyncSession = Depends(get_read_session)):
+    result = await db.execute(select(Products))
+    return result.scalars().all()
+
+
+@legacy.get("/order/all", response_model=list[Order])
+async def legacy_orders(db: AsyncSession = Depends(get_read_session)):
+    result = await db.execute(
+        select(OrderModel).where(OrderModel.status.not_in(["paid", "cancelled"]))
+    )
+    return result.scalars().all()
+
+
+async def seed(rows: int) -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            insert(Users), [{"email": "bench@example.com", "name": "bench", "password": "x"}]
+        )
+        await conn.execute(
+            insert(Products),
+            [
+                {"name": f"Product {i}", "price": 500 + i, "quantity": 100,
+                 "prod_type": "food", "image_path": f"/static/products/{i}.jpg"}
+                for i in range(rows)
+            ],
+        )
+        items = [
+            {"product_id": 1, "name": "Product 1", "quantity": 2, "price": 501},
+            {"product_id": 2, "name": "Product 2", "quantity": 1, "price": 502},
+        ]
+        await conn.execute(
+            insert(OrderModel),
+            [
+                {"user_id": 1, "user_name": "bench", "items": items, "code": str(i),
+                 "price": 1504, "comment": "", "status": "pending"}
+                for i in range(rows)
+            ],
+        )
+
+
+async def measure(client: AsyncClient, path: str, requests: int) -> float:
+    await client.get(path)
+    start = time.perf_counter()
+    for _ in range(requests):
+        rv = await client.get(path)
+        assert rv.status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+async def main(rows: int, requests: int) -> None:
+    await seed(rows)
+    app = create_app()
+    app.include_router(legacy)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        for path in ["/products/", "/order/all"]:
+            old = await measure(client, f"/legacy{path}", requests)
+            new = await measure(client, path, requests)
+            print(f"{path:<12} legacy={old:7.1f} req/s  fast={new:7.1f} req/s  x{new / old:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.requests))
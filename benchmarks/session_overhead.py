@@ -0,0 +1,86 @@
+"""
+Per-request overhead of the session dependency.
+
+    python -m benchmarks.session_overhead [--iterations 5000]
+
+Compares the previous dependency (a new async_scoped_session registry per
+request) with get_async_session and get_read_session, both for a request
+that never queries and for one that runs a single SELECT.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from asyncio import current_task
+
+_tmp = tempfile.mkdtemp(prefix="canteen-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp}/bench.db")
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.ext.asyncio import (  # noqa: E402
+    AsyncSession,
+    async_scoped_session,
+    async_sessionmaker,
+)
+
+from starlette.requests import Request  # noqa: E402
+
+from app.db.sessions import (  # noqa: E402
+    async_engine,
+    get_async_session,
+)
+from app.deps import get_read_session  # noqa: E402
+
+# get_read_session reads path_params; a route without user_id
+READ_REQUEST = Request({"type": "http", "path_params": {}})
+
+
+async def scoped_session_per_request():
+    Session = async_scoped_session(
+        async_sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            class_=AsyncSession,
+            bind=async_engine,
+            expire_on_commit=False,
+        ),
+        scopefunc=current_task,
+    )
+    async with Session() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+async def measure(dependency, iterations: int, query: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        gen = dependency()
+        session = await gen.__anext__()
+        if query:
+            await session.execute(text("SELECT 1"))
+        await gen.aclose()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main(iterations: int) -> None:
+    # Warm the pool so connection setup is not part of the numbers
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+    for name, dependency in [
+        ("scoped per request", scoped_session_per_request),
+        ("get_async_session", get_async_session),
+        ("get_read_session", lambda: get_read_session(READ_REQUEST)),
+    ]:
+        idle = await measure(dependency, iterations, query=False)
+        select_one = await measure(dependency, iterations, query=True)
+        print(f"{name:<20} no query={idle:7.1f} us   SELECT 1={select_one:7.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5000)
+    asyncio.run(main(parser.parse_args().iterations))
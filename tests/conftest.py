@@ -1,34 +1,83 @@
+import asyncio
+import os
+import tempfile
 from typing import AsyncGenerator, Any
 
-from sqlalchemy.ext.asyncio import (
-    create_async_engine,
-    AsyncSession,
-    async_scoped_session,
-    async_sessionmaker,
-)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.pool import NullPool
 
-from asyncio import current_task
 from httpx import AsyncClient
+import pytest
 import pytest_asyncio
 from os import getenv
 
 from app.app import create_app
 from app.db.sessions import Base, get_async_session
+from app.deps import get_read_session, principal_cache, user_cache, user_name_cache
+from app.rate_limit import backend as rate_limit_backend
+from app.subscriptions import product_type_cache
+from app.user_events import user_events
+from app.utils import revoked_refresh_tokens
 
+pytest_plugins = ["tests.query_budget"]
 
-SQLALCHEMY_TEST_DATABASE_URL = getenv(
-    "DATABASE_TEST_URL", "sqlite+aiosqlite:///async_test.db"
-)
 
-async_engine = create_async_engine(
-    SQLALCHEMY_TEST_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-async_test_session_local = async_scoped_session(
-    async_sessionmaker(
-        autocommit=False, autoflush=False, class_=AsyncSession, bind=async_engine
-    ),
-    scopefunc=current_task,
-)
+def _test_database_url() -> str:
+    """One database per test process, so pytest -n N doesn't share files.
+
+    DATABASE_TEST_URL may contain {worker} (the xdist worker id, or "main").
+    Without it, SQLite URLs get the worker id appended to the file name.
+    """
+    worker = getenv("PYTEST_XDIST_WORKER", "main")
+    url = getenv("DATABASE_TEST_URL")
+    if url is None:
+        # tmpfs where there is one; the file only lives for this run
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        return f"sqlite+aiosqlite:///{directory}/canteen_test_{os.getpid()}.db"
+    if "{worker}" in url:
+        return url.format(worker=worker)
+    if url.startswith("sqlite") and worker != "main":
+        root, ext = os.path.splitext(url)
+        return f"{root}_{worker}{ext}"
+    return url
+
+
+SQLALCHEMY_TEST_DATABASE_URL = _test_database_url()
+
+# NullPool: connections are bound to the event loop that opened them, and
+# schema setup runs in a different loop from the tests.
+async_engine = create_async_engine(SQLALCHEMY_TEST_DATABASE_URL, poolclass=NullPool)
+
+if async_engine.dialect.name == "sqlite":
+    # The sqlite3 driver's own transaction handling breaks SAVEPOINT; let
+    # SQLAlchemy emit BEGIN itself so the per-test rollback below works.
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(async_engine.sync_engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database_schema():
+    async def create():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def drop():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+
+    asyncio.run(create())
+    yield
+    asyncio.run(drop())
+    database = async_engine.url.database
+    if async_engine.dialect.name == "sqlite" and database and getenv("DATABASE_TEST_URL") is None:
+        os.remove(database)
 
 
 @pytest_asyncio.fixture
@@ -38,16 +87,21 @@ def anyio_backend():
 
 @pytest_asyncio.fixture()
 async def async_session() -> AsyncGenerator[AsyncSession, Any]:
-    # Create the database
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
+    """A session inside a transaction that is rolled back after the test.
 
-    db = async_test_session_local()
-    try:
-        yield db
-    finally:
-        await db.close()
+    commit() in the app and in tests only releases a SAVEPOINT, so every
+    test starts from the empty schema created once per run.
+    """
+    async with async_engine.connect() as conn:
+        transaction = await conn.begin()
+        db = AsyncSession(
+            bind=conn, autoflush=False, join_transaction_mode="create_savepoint"
+        )
+        try:
+            yield db
+        finally:
+            await db.close()
+            await transaction.rollback()
 
 
 @pytest_asyncio.fixture
@@ -59,7 +113,16 @@ async def async_client(async_session) -> AsyncGenerator[AsyncClient, Any]:
         finally:
             await async_session.close()
 
+    principal_cache.clear()
+    user_cache.clear()
+    user_name_cache.clear()
+    revoked_refresh_tokens.clear()
+    user_events.events.clear()
+    product_type_cache.clear()
+    rate_limit_backend.clear()
+
     app = create_app()
     app.dependency_overrides[get_async_session] = override_get_db
+    app.dependency_overrides[get_read_session] = override_get_db
     async with AsyncClient(app=app, base_url="http://testserver") as client:
         yield client
@@ -0,0 +1,43 @@
+"""
+pytest plugin: fail a test when a request runs more SQL than allowed.
+
+Budgets come from @query_budget(n) on the endpoint (app.db.instrumentation)
+or, per test, from @pytest.mark.query_budget("/route/template", n), which
+overrides the endpoint's own declaration.
+"""
+import pytest
+
+from app.db import instrumentation
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(route, n): fail if a request to route runs more than n SQL statements",
+    )
+
+
+@pytest.fixture(autouse=True)
+def _enforce_query_budgets(request):
+    overrides = {
+        marker.args[0]: marker.args[1]
+        for marker in request.node.iter_markers("query_budget")
+    }
+    violations: list[str] = []
+
+    def check(method, path, endpoint, stats):
+        budget = overrides.get(path, getattr(endpoint, "query_budget", None))
+        if budget is not None and stats.queries > budget:
+            statements = "\n    ".join(
+                f"{n}x {sql}" for sql, n in stats.statements.items()
+            )
+            violations.append(
+                f"{method} {path} ran {stats.queries} queries, budget is {budget}:\n    {statements}"
+            )
+
+    instrumentation.request_listeners.append(check)
+    yield
+    instrumentation.request_listeners.remove(check)
+
+    if violations:
+        pytest.fail("Query budget exceeded:\n" + "\n".join(violations), pytrace=False)
@@ -1,5 +1,8 @@
 from httpx import AsyncClient
 import pytest
+from sqlalchemy import insert
+
+from app.db.models import Users
 
 
 @pytest.mark.anyio
@@ -32,3 +35,217 @@ async def test_login(async_client: AsyncClient) -> None:
     }
     rv = await async_client.post("/auth/login", data=payload_login)
     assert rv.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_refresh_rotates_tokens(async_client: AsyncClient) -> None:
+    payload_register = {
+        "email": "user@example.com",
+        "name": "string",
+        "password": "string",
+    }
+    await async_client.post("/auth/register/", json=payload_register)
+
+    payload_login = {"email": "user@example.com", "password": "string"}
+    r = await async_client.post("/auth/login/", json=payload_login)
+    refresh_token = r.json()["refresh_token"]
+
+    rv = await async_client.post("/auth/refresh", json={"refresh_token": refresh_token})
+    assert rv.status_code == 200
+    assert rv.json()["email"] == "user@example.com"
+    assert rv.json()["refresh_token"] != refresh_token
+
+    # The old refresh token was rotated out and cannot be replayed
+    rv = await async_client.post("/auth/refresh", json={"refresh_token": refresh_token})
+    assert rv.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_refresh_rejects_access_token(async_client: AsyncClient) -> None:
+    payload_register = {
+        "email": "user@example.com",
+        "name": "string",
+        "password": "string",
+    }
+    await async_client.post("/auth/register/", json=payload_register)
+
+    payload_login = {"email": "user@example.com", "password": "string"}
+    r = await async_client.post("/auth/login/", json=payload_login)
+
+    rv = await async_client.post(
+        "/auth/refresh", json={"refresh_token": r.json()["access_token"]}
+    )
+    assert rv.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_login_rehashes_outdated_cost(async_client: AsyncClient, async_session) -> None:
+    import bcrypt
+    from sqlalchemy import select
+    from app.db.models import Users
+    from app.utils import BCRYPT_ROUNDS
+
+    weak_hash = bcrypt.hashpw(b"string", bcrypt.gensalt(rounds=4)).decode()
+    async_session.add(Users(email="user@example.com", name="string", password=weak_hash))
+    await async_session.commit()
+
+    payload_login = {"email": "user@example.com", "password": "string"}
+    rv = await async_client.post("/auth/login/", json=payload_login)
+    assert rv.status_code == 200
+
+    user = (await async_session.scalars(select(Users))).one()
+    assert user.password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+
+
+@pytest.mark.anyio
+async def test_register_bulk(async_client: AsyncClient) -> None:
+    payload_register = {
+        "email": "user@example.com",
+        "name": "string",
+        "password": "string",
+    }
+    await async_client.post("/auth/register/", json=payload_register)
+
+    payload_login = {"email": "user@example.com", "password": "string"}
+    r = await async_client.post("/auth/login/", json=payload_login)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    rows = [
+        {"email": "one@example.com", "name": "one", "password": "string"},
+        {"email": "user@example.com", "name": "exists", "password": "string"},
+        {"email": "one@example.com", "name": "again", "password": "string"},
+        {"email": "not-an-email", "name": "bad", "password": "string"},
+        {"email": 5, "name": "bad", "password": "string"},
+    ]
+    rv = await async_client.post("/auth/register/bulk", json=rows, headers=headers)
+    assert rv.status_code == 200
+    assert rv.json()["created"] == 1
+    statuses = [row["status"] for row in rv.json()["results"]]
+    assert statuses == ["created", "exists", "duplicate", "invalid", "invalid"]
+    assert rv.json()["results"][4]["email"] is None
+
+    csv_body = "email,name,password\ntwo@example.com,two,string\n"
+    rv = await async_client.post(
+        "/auth/register/bulk",
+        content=csv_body,
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+    assert rv.json()["results"][0]["status"] == "created"
+
+    r = await async_client.post(
+        "/auth/login/", json={"email": "two@example.com", "password": "string"}
+    )
+    assert r.status_code == 200
+
+    rv = await async_client.post(
+        "/auth/register/bulk",
+        content=b"email,name,password\nthree@example.com,\xff\xfe,string\n",
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+    assert rv.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_register_bulk_reports_only_concurrent_conflicts(
+    async_client: AsyncClient, async_session, monkeypatch
+) -> None:
+    from app.routers import auth
+
+    await async_client.post(
+        "/auth/register/", json={"email": "user@example.com", "name": "string", "password": "string"}
+    )
+    r = await async_client.post("/auth/login/", json={"email": "user@example.com", "password": "string"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    hash_passwords = auth.hash_passwords_parallel
+
+    async def hash_then_race(passwords):
+        hashes = await hash_passwords(passwords)
+        # Registered by someone else after the existence check
+        await async_session.execute(
+            insert(Users).values(email="race@example.com", name="race", password="x")
+        )
+        await async_session.commit()
+        return hashes
+
+    monkeypatch.setattr(auth, "hash_passwords_parallel", hash_then_race)
+    rows = [
+        {"email": "one@example.com", "name": "one", "password": "string"},
+        {"email": "race@example.com", "name": "race", "password": "string"},
+        {"email": "two@example.com", "name": "two", "password": "string"},
+    ]
+    rv = await async_client.post("/auth/register/bulk", json=rows, headers=headers)
+    assert rv.json()["created"] == 2
+    statuses = [row["status"] for row in rv.json()["results"]]
+    assert statuses == ["created", "exists", "created"]
+
+
+@pytest.mark.anyio
+async def test_login_rate_limited(async_client: AsyncClient, monkeypatch) -> None:
+    from app.rate_limit import login_limit
+
+    monkeypatch.setattr(login_limit, "capacity", 2)
+    payload = {"email": "nobody@example.com", "password": "string"}
+    for _ in range(2):
+        rv = await async_client.post("/auth/login/", json=payload)
+        assert rv.status_code == 400
+
+    rv = await async_client.post("/auth/login/", json=payload)
+    assert rv.status_code == 429
+    assert 1 <= int(rv.headers["Retry-After"]) <= 60
+
+
+@pytest.mark.anyio
+async def test_only_failed_logins_count_against_the_account(
+    async_client: AsyncClient, monkeypatch
+) -> None:
+    from app.rate_limit import backend, login_failure_limit
+
+    monkeypatch.setattr(login_failure_limit, "capacity", 2)
+    await async_client.post(
+        "/auth/register/", json={"email": "user@example.com", "name": "string", "password": "string"}
+    )
+    good = {"email": "user@example.com", "password": "string"}
+    bad = {"email": "user@example.com", "password": "wrong"}
+
+    for _ in range(3):
+        assert (await async_client.post("/auth/login/", json=good)).status_code == 200
+    for _ in range(2):
+        assert (await async_client.post("/auth/login/", json=bad)).status_code == 400
+
+    rv = await async_client.post("/auth/login/", json=good)
+    assert rv.status_code == 429
+    # The blocked attempt didn't use up a token of the IP bucket
+    ip_key = next(key for key in backend.full_at if key.startswith("login:ip:"))
+    full_at = backend.full_at[ip_key]
+    await async_client.post("/auth/login/", json=good)
+    assert backend.full_at[ip_key] == full_at
+
+
+@pytest.mark.anyio
+async def test_refresh_token_is_not_an_access_token(async_client: AsyncClient) -> None:
+    payload_register = {
+        "email": "user@example.com",
+        "name": "string",
+        "password": "string",
+    }
+    await async_client.post("/auth/register/", json=payload_register)
+
+    payload_login = {"email": "user@example.com", "password": "string"}
+    r = await async_client.post("/auth/login/", json=payload_login)
+    user_id = r.json()["user_id"]
+    refresh_token = r.json()["refresh_token"]
+
+    rv = await async_client.get(
+        f"/users/get/user/{user_id}",
+        headers={"Authorization": f"Bearer {r.json()['access_token']}"},
+    )
+    assert rv.status_code == 200
+
+    # Rotated out, and never valid as a bearer token in the first place
+    await async_client.post("/auth/refresh", json={"refresh_token": refresh_token})
+    rv = await async_client.get(
+        f"/users/get/user/{user_id}",
+        headers={"Authorization": f"Bearer {refresh_token}"},
+    )
+    assert rv.status_code == 403
@@ -0,0 +1,129 @@
+import asyncio
+
+from httpx import AsyncClient
+import pytest
+
+from app.db.models import Products
+from app.outbox import outbox
+
+
+async def _seed(async_client: AsyncClient, async_session) -> None:
+    payload_register = {
+        "email": "user@example.com",
+        "name": "string",
+        "password": "string",
+    }
+    await async_client.post("/auth/register/", json=payload_register)
+    async_session.add(Products(name="Plov", price=1200, quantity=10, prod_type="food"))
+    await async_session.commit()
+
+
+@pytest.mark.anyio
+async def test_create_and_list_orders(async_client: AsyncClient, async_session) -> None:
+    await _seed(async_client, async_session)
+
+    payload_order = {
+        "user_id": 1,
+        "items": [{"product_id": 1, "name": "Plov", "quantity": 2, "price": 1200}],
+        "comment": "no onions",
+        "price": 2400,
+    }
+    rv = await async_client.post("/order/create", json=payload_order)
+    assert rv.status_code == 200
+    created = rv.json()
+
+    rv = await async_client.get("/order/all")
+    assert rv.status_code == 200
+    assert rv.json() == [created]
+
+    rv = await async_client.get("/order/1")
+    assert rv.json() == [created]
+
+    rv = await async_client.get("/products/")
+    assert rv.json()[0]["quantity"] == 8
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget("/order/create", 7)
+async def test_create_order_query_budget(async_client: AsyncClient, async_session) -> None:
+    await _seed(async_client, async_session)
+
+    payload_order = {
+        "user_id": 1,
+        "items": [{"product_id": 1, "name": "Plov", "quantity": 1, "price": 1200}],
+        "comment": "",
+        "price": 1200,
+    }
+    rv = await async_client.post("/order/create", json=payload_order)
+    assert rv.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_long_poll_receives_status_change(async_client: AsyncClient, async_session) -> None:
+    await _seed(async_client, async_session)
+    payload_order = {
+        "user_id": 1,
+        "items": [{"product_id": 1, "name": "Plov", "quantity": 1, "price": 1200}],
+        "comment": "",
+        "price": 1200,
+    }
+    order_id = (await async_client.post("/order/create", json=payload_order)).json()["id"]
+
+    rv = await async_client.get("/order/poll/1", params={"timeout": 0})
+    assert rv.json()["events"] == []
+    after = rv.json()["last_event_id"]
+
+    poll = asyncio.create_task(async_client.get("/order/poll/1", params={"after": after}))
+    await asyncio.sleep(0.05)
+    assert not poll.done()
+    await async_client.patch(f"/order/{order_id}", json={"status": "ready"})
+    # Broadcasts go out through the outbox once the PATCH has committed
+    assert not poll.done()
+    assert await outbox.dispatch_once(async_session) == 2
+
+    body = (await asyncio.wait_for(poll, 5)).json()
+    assert body["events"] == [{"type": "status_changed", "order_id": order_id, "status": "ready"}]
+    assert body["last_event_id"] > after
+    assert body["resync"] is False
+
+
+@pytest.mark.anyio
+async def test_concurrent_menu_reads_are_coalesced(async_client: AsyncClient, async_session) -> None:
+    from app.single_flight import SHARED_TOTAL
+
+    await _seed(async_client, async_session)
+    key = ("app.routers.products.get_all_products",)
+    before = SHARED_TOTAL.values.get(key, 0)
+
+    responses = await asyncio.gather(*(async_client.get("/products/") for _ in range(5)))
+    assert {rv.status_code for rv in responses} == {200}
+    assert len({rv.content for rv in responses}) == 1
+    assert responses[0].json()[0]["name"] == "Plov"
+    # Everyone after the first request shared its response
+    assert SHARED_TOTAL.values.get(key, 0) - before == 4
+
+
+@pytest.mark.anyio
+async def test_order_limit_is_keyed_on_the_token_not_the_body(
+    async_client: AsyncClient, async_session, monkeypatch
+) -> None:
+    from app.rate_limit import order_create_limit
+
+    monkeypatch.setattr(order_create_limit, "capacity", 1)
+    await _seed(async_client, async_session)
+    payload_order = {
+        "user_id": 1,
+        "items": [{"product_id": 1, "name": "Plov", "quantity": 1, "price": 1200}],
+        "comment": "",
+        "price": 1200,
+    }
+    # Without a token only the IP limit applies, whatever user_id says
+    for _ in range(2):
+        assert (await async_client.post("/order/create", json=payload_order)).status_code == 200
+
+    r = await async_client.post("/auth/login/", json={"email": "user@example.com", "password": "string"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    rv = await async_client.post("/order/create", json=payload_order, headers=headers)
+    assert rv.status_code == 200
+    rv = await async_client.post("/order/create", json=payload_order, headers=headers)
+    assert rv.status_code == 429
@@ -78,3 +78,84 @@ async def test_delete_user(async_client: AsyncClient) -> None:
 
     rv = await async_client.delete("users/delete/user/2", headers=headers)
     assert rv.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_current_user_is_cached(async_client: AsyncClient) -> None:
+    payload_register = {
+        "email": "user@example.com",
+        "name": "string",
+        "password": "string",
+    }
+    await async_client.post("/auth/register/", json=payload_register)
+
+    payload_login = {"email": "user@example.com", "password": "string"}
+    r = await async_client.post("/auth/login/", json=payload_login)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    for _ in range(3):
+        rv = await async_client.get("users/get/user/1", headers=headers)
+        assert rv.status_code == 200
+
+    stats = (await async_client.get("/health/auth-cache")).json()
+    assert stats["principals"]["hits"] == 2
+    assert stats["users"]["hits"] == 2
+
+    await async_client.put("/auth/edit/1", json={"name": "renamed"})
+    stats = (await async_client.get("/health/auth-cache")).json()
+    assert stats["users"]["size"] == 0
+
+
+@pytest.mark.anyio
+async def test_get_users_paginated_and_search(async_client: AsyncClient) -> None:
+    for email, name in [
+        ("user@example.com", "Admin"),
+        ("aidana@example.com", "Aidana Sarsen"),
+        ("bolat@example.com", "Bolat Aidarov"),
+    ]:
+        payload_register = {"email": email, "name": name, "password": "string"}
+        await async_client.post("/auth/register/", json=payload_register)
+
+    payload_login = {"email": "user@example.com", "password": "string"}
+    r = await async_client.post("/auth/login/", json=payload_login)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    rv = await async_client.get("users/get/users?limit=2", headers=headers)
+    assert rv.status_code == 200
+    assert [u["id"] for u in rv.json()] == [1, 2]
+    assert "password" not in rv.json()[0]
+    after_id = rv.headers["X-Next-After-Id"]
+
+    rv = await async_client.get(f"users/get/users?limit=2&after_id={after_id}", headers=headers)
+    assert [u["id"] for u in rv.json()] == [3]
+    assert "X-Next-After-Id" not in rv.headers
+
+    rv = await async_client.get("users/search?q=AID", headers=headers)
+    assert [u["email"] for u in rv.json()] == ["aidana@example.com"]
+
+    rv = await async_client.get("users/search?q=bolat@", headers=headers)
+    assert [u["name"] for u in rv.json()] == ["Bolat Aidarov"]
+
+    # Not only ASCII: SQLite's lower() wouldn't fold these
+    payload_register = {"email": "aigerim@example.com", "name": "Айгерім Нұрлан", "password": "string"}
+    await async_client.post("/auth/register/", json=payload_register)
+    rv = await async_client.get("users/search?q=АЙГЕРІМ", headers=headers)
+    assert [u["email"] for u in rv.json()] == ["aigerim@example.com"]
+
+
+@pytest.mark.anyio
+async def test_get_user_names(async_client: AsyncClient) -> None:
+    for email, name in [("one@example.com", "One"), ("two@example.com", "Two")]:
+        payload_register = {"email": email, "name": name, "password": "string"}
+        await async_client.post("/auth/register/", json=payload_register)
+
+    rv = await async_client.get("users/names?ids=1,2,99")
+    assert rv.status_code == 200
+    assert rv.json() == {"1": "One", "2": "Two"}
+
+    await async_client.put("/auth/edit/2", json={"name": "Renamed"})
+    rv = await async_client.get("users/names?ids=2")
+    assert rv.json() == {"2": "Renamed"}
+
+    rv = await async_client.get("users/names?ids=1,x")
+    assert rv.status_code == 422
@@ -6,3 +6,27 @@ import pytest
 async def test_health(async_client: AsyncClient) -> None:
     rv = await async_client.get("/health")
     assert rv.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_metrics(async_client: AsyncClient) -> None:
+    await async_client.get("/health")
+    await async_client.get("/users/names?ids=1")
+
+    rv = await async_client.get("/metrics")
+    assert rv.status_code == 200
+    body = rv.text
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in body
+    assert 'db_queries_per_request_count{route="/users/names"}' in body
+    assert "ws_order_connections 0" in body
+    assert "hash_pool_queue_depth 0" in body
+
+
+@pytest.mark.anyio
+async def test_sql_debug_headers(async_client: AsyncClient, monkeypatch) -> None:
+    from app import metrics
+
+    monkeypatch.setattr(metrics, "SQL_DEBUG_HEADERS", True)
+    rv = await async_client.get("/users/names?ids=1,2")
+    assert rv.headers["X-DB-Query-Count"] == "1"
+    assert float(rv.headers["X-DB-Time-Ms"]) >= 0
@@ -0,0 +1,33 @@
+from time import time
+
+from app.cache import TTLCache
+
+
+def test_ttl_cache_lru_eviction() -> None:
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_expiry_is_capped() -> None:
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("token", "user@example.com", expires_at=time() - 1)
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_clear_resets_counters() -> None:
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    cache.clear()
+    assert cache.stats() == {"size": 0, "maxsize": 10, "hits": 0, "misses": 0}
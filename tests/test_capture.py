@@ -0,0 +1,86 @@
+import asyncio
+
+import orjson
+from httpx import ASGITransport, AsyncClient
+import pytest
+
+from app import capture
+from app.capture import CaptureMiddleware
+
+
+async def echo(scope, receive, send):
+    body = (await receive())["body"]
+    await send({"type": "http.response.start", "status": 201, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+@pytest.mark.anyio
+async def test_capture_writes_redacted_jsonl(tmp_path) -> None:
+    app = CaptureMiddleware(echo, directory=str(tmp_path), sample_rate=1.0)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        rv = await client.post(
+            "/auth/login/?x=1", json={"email": "user@example.com", "password": "string"}
+        )
+    assert rv.status_code == 201
+
+    path = tmp_path / "requests.jsonl"
+    for _ in range(50):
+        if path.exists() and path.read_text():
+            break
+        await asyncio.sleep(0.01)
+
+    record = orjson.loads(path.read_text().splitlines()[0])
+    assert record["method"] == "POST"
+    assert record["path"] == "/auth/login/"
+    assert record["query"] == "x=1"
+    assert record["status"] == 201
+    assert record["json"] == {"email": "user@example.com", "password": "***"}
+    assert record["headers"]["content-type"] == "application/json"
+
+
+async def capture_one(tmp_path, **kwargs) -> dict:
+    app = CaptureMiddleware(echo, directory=str(tmp_path), sample_rate=1.0)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        await client.post("/auth/register/bulk", **kwargs)
+
+    path = tmp_path / "requests.jsonl"
+    for _ in range(50):
+        if path.exists() and path.read_text():
+            break
+        await asyncio.sleep(0.01)
+    return orjson.loads(path.read_text().splitlines()[0])
+
+
+@pytest.mark.anyio
+async def test_capture_drops_truncated_json(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(capture, "CAPTURE_MAX_BODY", 40)
+    record = await capture_one(
+        tmp_path, json=[{"email": "user@example.com", "password": "hunter2"}]
+    )
+    assert record["truncated"] is True
+    assert "json" not in record and "body" not in record
+    assert "hunt" not in orjson.dumps(record).decode()
+
+
+@pytest.mark.anyio
+async def test_capture_redacts_csv_columns(tmp_path) -> None:
+    record = await capture_one(
+        tmp_path,
+        content=b"email,name,password\r\na@b.c,x,hunter2\r\n",
+        headers={"content-type": "text/csv"},
+    )
+    assert record["body"] == "email,name,password\r\na@b.c,x,***\r\n"
+
+
+@pytest.mark.anyio
+async def test_capture_redacts_form_fields(tmp_path) -> None:
+    record = await capture_one(tmp_path, data={"username": "a@b.c", "password": "hunter2"})
+    assert record["form"] == [["username", "a@b.c"], ["password", "***"]]
+
+
+@pytest.mark.anyio
+async def test_capture_drops_bodies_it_cannot_redact(tmp_path) -> None:
+    record = await capture_one(
+        tmp_path, content=b"password=hunter2", headers={"content-type": "text/plain"}
+    )
+    assert "body" not in record and "form" not in record
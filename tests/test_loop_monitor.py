@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+from httpx import AsyncClient
+import pytest
+
+from app.loop_monitor import LoopMonitor, loop_monitor
+
+
+def block_the_loop() -> None:
+    time.sleep(0.4)
+
+
+@pytest.mark.anyio
+async def test_monitor_reports_stall_stack() -> None:
+    monitor = LoopMonitor(interval=0.02, stall_threshold=0.1)
+    monitor.start()
+    await asyncio.sleep(0.05)
+
+    block_the_loop()
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    assert monitor.stalls == 1
+    assert monitor.max_lag > 0.2
+    assert "block_the_loop" in monitor.last_stall_stack
+
+
+@pytest.mark.anyio
+async def test_lagging_loop_sheds_broadcast(async_client: AsyncClient, monkeypatch) -> None:
+    monkeypatch.setattr(loop_monitor, "lag", 1.0)
+
+    rv = await async_client.post("/order/broadcast")
+    assert rv.status_code == 503
+    assert rv.headers["Retry-After"] == "2"
+
+    # Critical routes are never shed
+    rv = await async_client.get("/order/all")
+    assert rv.status_code == 200
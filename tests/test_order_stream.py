@@ -0,0 +1,100 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+import orjson
+import pytest
+
+from app.app import create_app
+from app.order_stream import (
+    OrderEvent,
+    OrderStream,
+    PROTOCOL_V2,
+    PROTOCOL_V2_BINARY,
+    order_data,
+)
+
+
+def order(status: str = "pending"):
+    return SimpleNamespace(
+        id=3, user_id=1, user_name="string", code="123", price=2400, comment="",
+        items=[{"product_id": 1, "name": "Plov", "quantity": 2, "price": 1200}],
+        status=status, timestamp=datetime(2024, 1, 1, 12, 0),
+    )
+
+
+def test_v2_sends_full_order_once_then_deltas() -> None:
+    stream = OrderStream(PROTOCOL_V2)
+
+    created = orjson.loads(stream.frame(OrderEvent("order_created", order_data(order()))))
+    assert created["type"] == "order_created"
+    assert created["data"]["items"][0]["name"] == "Plov"
+
+    ready = OrderEvent("order_update", order_data(order("ready")), changed=("status",))
+    assert orjson.loads(stream.frame(ready)) == {
+        "type": "order_delta", "id": 3, "data": {"status": "ready"},
+    }
+
+    # Paid orders are forgotten; a later event for the id is sent in full
+    stream.frame(OrderEvent("order_update", order_data(order("paid")), changed=("status",)))
+    assert stream.known == {}
+
+
+def test_text_is_decoded_once_per_event() -> None:
+    event = OrderEvent("order_created", order_data(order()))
+    assert event.full_text == event.full.decode()
+    assert event.full_text is event.full_text
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames: list[bytes | str] = []
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def send_bytes(self, payload):
+        self.frames.append(payload)
+
+
+@pytest.mark.anyio
+async def test_send_uses_the_negotiated_frame_type() -> None:
+    text, binary = FakeSocket(), FakeSocket()
+    text_stream, binary_stream = OrderStream(PROTOCOL_V2), OrderStream(PROTOCOL_V2_BINARY)
+    created = OrderEvent("order_created", order_data(order()))
+    ready = OrderEvent("order_update", order_data(order("ready")), changed=("status",))
+    for event in (created, ready):
+        await text_stream.send(text, event)
+        await binary_stream.send(binary, event)
+
+    # The same encoded event is shared by every socket of a frame type
+    assert text.frames == [created.full_text, ready.delta_text]
+    assert binary.frames == [created.full, ready.delta]
+    assert orjson.loads(text.frames[1]) == {
+        "type": "order_delta", "id": 3, "data": {"status": "ready"},
+    }
+
+
+def test_v1_always_gets_full_orders() -> None:
+    stream = OrderStream()
+    stream.frame(OrderEvent("order_created", order_data(order())))
+
+    message = orjson.loads(
+        stream.frame(OrderEvent("order_update", order_data(order("ready")), changed=("status",)))
+    )
+    assert message["type"] == "order_update"
+    assert message["data"]["status"] == "ready"
+    assert message["data"]["items"]
+
+
+def test_subprotocol_negotiation() -> None:
+    with TestClient(create_app()) as client:
+        with client.websocket_connect("/order/ws", subprotocols=["orders.v2.binary"]) as ws:
+            assert ws.accepted_subprotocol == "orders.v2.binary"
+            # Control messages use the negotiated binary frames too
+            assert ws.receive_json(mode="binary")["version"] == 2
+            ws.send_json({"action": "ping"})
+            assert ws.receive_json(mode="binary") == {"type": "pong"}
+        with client.websocket_connect("/order/ws") as ws:
+            assert ws.accepted_subprotocol is None
+            assert ws.receive_json()["version"] == 1
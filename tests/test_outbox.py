@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import OutboxEvent
+from app.outbox import Outbox
+
+
+def make_outbox() -> Outbox:
+    return Outbox(None, batch_size=10, poll_interval=1, max_attempts=2, retry_base=60)
+
+
+@pytest.mark.anyio
+async def test_runs_are_delivered_in_order_and_deleted(async_session) -> None:
+    box = make_outbox()
+    seen = []
+
+    @box.consumer("a")
+    async def consume_a(session, payloads):
+        seen.append(("a", [p["n"] for p in payloads]))
+
+    @box.consumer("b")
+    async def consume_b(session, payloads):
+        seen.append(("b", [p["n"] for p in payloads]))
+
+    for topic, n in (("a", 1), ("a", 2), ("b", 3), ("a", 4)):
+        box.add(async_session, topic, {"n": n})
+    await async_session.commit()
+
+    assert await box.dispatch_once(async_session) == 4
+    assert seen == [("a", [1, 2]), ("b", [3]), ("a", [4])]
+    assert (await async_session.execute(select(OutboxEvent))).scalars().all() == []
+
+
+@pytest.mark.anyio
+async def test_failures_back_off_then_go_dead(async_session) -> None:
+    box = make_outbox()
+    calls = 0
+
+    @box.consumer("flaky")
+    async def flaky(session, payloads):
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("socket layer down")
+
+    box.add(async_session, "flaky", {})
+    await async_session.commit()
+
+    assert await box.dispatch_once(async_session) == 1
+    event = (await async_session.execute(select(OutboxEvent))).scalar_one()
+    assert event.attempts == 1
+    assert "socket layer down" in event.last_error
+    assert event.available_at > datetime.utcnow()
+
+    # Not due yet
+    assert await box.dispatch_once(async_session) == 0
+
+    event.available_at = datetime.utcnow()
+    await async_session.commit()
+    await box.dispatch_once(async_session)
+    await async_session.refresh(event)
+    assert calls == 2
+    assert event.dead_at is not None
+    assert await box.dispatch_once(async_session) == 0
+
+
+@pytest.mark.anyio
+async def test_failed_event_holds_up_only_its_topic(async_session) -> None:
+    box = make_outbox()
+    seen = []
+    failures = 1
+
+    @box.consumer("status")
+    async def consume_status(session, payloads):
+        nonlocal failures
+        if payloads[0]["n"] == 1 and failures:
+            failures -= 1
+            raise RuntimeError("socket layer down")
+        seen.extend(p["n"] for p in payloads)
+
+    @box.consumer("other")
+    async def consume_other(session, payloads):
+        seen.extend(p["n"] for p in payloads)
+
+    for topic, n in (("status", 1), ("other", 2), ("status", 3)):
+        box.add(async_session, topic, {"n": n})
+    await async_session.commit()
+
+    await box.dispatch_once(async_session)
+    assert seen == [2]
+    # 3 waits for 1's retry
+    assert await box.dispatch_once(async_session) == 0
+
+    first = (
+        await async_session.execute(select(OutboxEvent).where(OutboxEvent.attempts == 1))
+    ).scalar_one()
+    first.available_at = datetime.utcnow()
+    await async_session.commit()
+    assert await box.dispatch_once(async_session) == 2
+    assert seen == [2, 1, 3]
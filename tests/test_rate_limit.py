@@ -0,0 +1,59 @@
+from app.rate_limit import MemoryBackend, SQLiteBackend
+
+
+def test_bucket_allows_burst_then_refills():
+    backend = MemoryBackend(max_keys=100)
+    # 3 per 30 s: a token every 10 s
+    bucket = [("k", 3, 10.0)]
+    assert [backend.take(bucket, 1000.0)[0] for _ in range(3)] == [-20.0, -10.0, 0]
+    assert backend.take(bucket, 1000.0) == [10.0]
+    assert backend.take(bucket, 1004.0) == [6.0]
+    assert backend.take(bucket, 1010.0) == [0]
+    # Other keys have their own bucket
+    assert backend.take([("other", 3, 10.0)], 1010.0) == [-20.0]
+
+
+def test_tokens_are_taken_only_when_every_bucket_has_one():
+    backend = MemoryBackend(max_keys=100)
+    backend.take([("account", 1, 10.0)], 1000.0)
+    assert backend.take([("ip", 2, 10.0), ("account", 1, 10.0)], 1000.0) == [-10.0, 10.0]
+    # The ip bucket wasn't charged for the rejected request
+    assert "ip" not in backend.full_at
+
+    # Peeking never takes a token
+    backend.take([("ip", 2, 10.0)], 1000.0, consume=False)
+    assert "ip" not in backend.full_at
+
+
+def test_full_buckets_are_evicted_lazily():
+    backend = MemoryBackend(max_keys=3)
+    backend.take([("a", 3, 10.0)], 1000.0)
+    backend.take([("b", 3, 10.0)], 1000.0)
+    backend.take([("c", 3, 10.0)], 1015.0)
+    # a and b are full again by now, so adding d drops them
+    backend.take([("d", 3, 10.0)], 1015.0)
+    assert set(backend.full_at) == {"c", "d"}
+
+
+def test_eviction_drops_oldest_when_everything_is_active():
+    backend = MemoryBackend(max_keys=10)
+    for i in range(10):
+        backend.take([(str(i), 3, 10.0)], 1000.0)
+    backend.take([("new", 3, 10.0)], 1000.0)
+    assert "0" not in backend.full_at
+    assert len(backend.full_at) == 10
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / "limits.db")
+    worker1 = SQLiteBackend(path, max_keys=100)
+    worker2 = SQLiteBackend(path, max_keys=100)
+    bucket = [("k", 2, 10.0)]
+    assert worker1.take(bucket, 1000.0) == [-10.0]
+    assert worker2.take(bucket, 1000.0) == [0]
+    assert worker1.take(bucket, 1000.0) == [10.0]
+    assert worker2.take(bucket, 1010.0) == [0]
+
+    # All or nothing, as in memory
+    assert worker1.take([("other", 2, 10.0), ("k", 2, 10.0)], 1010.0) == [-10.0, 10.0]
+    assert worker2.take([("other", 1, 10.0)], 1010.0) == [0]
@@ -0,0 +1,41 @@
+from sqlalchemy import insert, select
+import pytest
+
+from app.db import sessions
+from app.db.models import Users
+
+
+@pytest.mark.anyio
+async def test_read_routing_with_sqlite_replica(tmp_path, monkeypatch) -> None:
+    primary = sessions.build_async_engine(f"sqlite+aiosqlite:///{tmp_path}/primary.db")
+    replica = sessions.build_async_engine(f"sqlite+aiosqlite:///{tmp_path}/replica.db")
+    for engine in (primary, replica):
+        async with engine.begin() as conn:
+            await conn.run_sync(sessions.Base.metadata.create_all)
+
+    # The "replica" never receives this row, like a lagging follower
+    async with primary.begin() as conn:
+        await conn.execute(
+            insert(Users), [{"email": "user@example.com", "name": "string", "password": "x"}]
+        )
+
+    monkeypatch.setattr(sessions, "read_session_maker", sessions._read_only_session_maker(primary))
+    monkeypatch.setattr(sessions, "replica_session_makers", [sessions._read_only_session_maker(replica)])
+    sessions.recent_writers.clear()
+
+    async with sessions.read_session_for(1) as db:
+        assert (await db.scalars(select(Users))).all() == []
+
+    sessions.mark_user_write(1)
+    async with sessions.read_session_for(1) as db:
+        assert len((await db.scalars(select(Users))).all()) == 1
+    async with sessions.read_session_for(2) as db:
+        assert (await db.scalars(select(Users))).all() == []
+
+    async with sessions.read_session_for(2) as db:
+        db.add(Users(email="other@example.com", name="string", password="x"))
+        with pytest.raises(RuntimeError):
+            await db.flush()
+
+    await primary.dispose()
+    await replica.dispose()
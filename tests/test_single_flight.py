@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from fastapi import Depends, Request
+from fastapi.responses import ORJSONResponse
+from starlette.background import BackgroundTask
+
+from app.single_flight import in_flight, single_flight
+
+
+def get_db():
+    return object()
+
+
+def make_endpoint():
+    calls = []
+    release = asyncio.Event()
+
+    @single_flight
+    async def endpoint(status: str = "all", db=Depends(get_db)):
+        calls.append(status)
+        await release.wait()
+        if status == "broken":
+            raise ValueError(status)
+        return ORJSONResponse([{"status": status, "call": len(calls)}])
+
+    return endpoint, calls, release
+
+
+@pytest.mark.anyio
+async def test_identical_calls_share_one_execution() -> None:
+    endpoint, calls, release = make_endpoint()
+    # Different sessions, same parameters: one call
+    pending = [asyncio.ensure_future(endpoint(status="all", db=object())) for _ in range(5)]
+    other = asyncio.ensure_future(endpoint(status="pending", db=object()))
+    await asyncio.sleep(0)
+    release.set()
+    responses = await asyncio.gather(*pending, other)
+
+    assert sorted(calls) == ["all", "pending"]
+    assert {r.body for r in responses[:5]} == {b'[{"status":"all","call":1}]'}
+    assert len({id(r) for r in responses}) == 6
+    assert not in_flight
+
+    # Finished calls aren't cached
+    await endpoint(status="all", db=object())
+    assert calls.count("all") == 2
+
+
+@pytest.mark.anyio
+async def test_errors_reach_every_waiter() -> None:
+    endpoint, calls, release = make_endpoint()
+    pending = [asyncio.ensure_future(endpoint(status="broken", db=object())) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*pending, return_exceptions=True)
+
+    assert calls == ["broken"]
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+@pytest.mark.anyio
+async def test_cancelled_leader_does_not_cancel_followers() -> None:
+    endpoint, calls, release = make_endpoint()
+    leader = asyncio.ensure_future(endpoint(db=object()))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(endpoint(db=object()))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+
+    assert (await follower).body == b'[{"status":"all","call":1}]'
+    assert calls == ["all"]
+
+
+@pytest.mark.anyio
+async def test_followers_get_headers_and_background() -> None:
+    release = asyncio.Event()
+    ran = []
+
+    @single_flight
+    async def endpoint(db=Depends(get_db)):
+        await release.wait()
+        response = ORJSONResponse(
+            [], headers={"Cache-Control": "max-age=5"}, background=BackgroundTask(ran.append, 1)
+        )
+        response.set_cookie("seen", "1")
+        return response
+
+    pending = [asyncio.ensure_future(endpoint(db=object())) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+    leader, follower = await asyncio.gather(*pending)
+
+    assert follower.raw_headers == leader.raw_headers
+    assert follower.headers["cache-control"] == "max-age=5"
+    assert follower.headers["content-type"] == "application/json"
+    assert follower.background is leader.background
+
+
+def test_per_request_parameters_are_refused() -> None:
+    async def endpoint(request: Request):
+        return None
+
+    with pytest.raises(TypeError):
+        single_flight(endpoint)
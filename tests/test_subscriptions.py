@@ -0,0 +1,60 @@
+from fastapi.testclient import TestClient
+
+from app.app import create_app
+from app.order_stream import OrderStream
+from app.subscriptions import SubscriptionRouter
+
+
+def keys(order_id=1, code="123", prod_types=("food",), status="pending", previous=None):
+    return {
+        "order_id": (order_id,),
+        "code": (code,),
+        "prod_type": set(prod_types),
+        "status": (status, previous),
+    }
+
+
+def matched(router: SubscriptionRouter, event: dict) -> set[str]:
+    return {s.websocket for s in router.match(event)}
+
+
+def test_events_reach_only_matching_subscribers() -> None:
+    router = SubscriptionRouter()
+    router.subscribe("all", OrderStream())
+    router.subscribe("drinks", OrderStream(), {"prod_type": ["drink"]})
+    router.subscribe("ready_food", OrderStream(), {"prod_type": ["food"], "status": ["ready"]})
+    router.subscribe("order_7", OrderStream(), {"order_id": [7]})
+    router.subscribe("pending", OrderStream(), {"status": ["pending"]})
+
+    assert matched(router, keys()) == {"all", "pending"}
+    assert matched(router, keys(prod_types=("food", "drink"), status="ready", previous="pending")) == {
+        "all", "drinks", "ready_food", "pending",
+    }
+    # Leaving "ready" is still news to a "ready" screen
+    assert matched(router, keys(order_id=7, status="paid", previous="ready")) == {
+        "all", "order_7", "ready_food",
+    }
+    assert matched(router, keys(order_id=7, status="paid", previous="paid")) == {"all", "order_7"}
+
+
+def test_resubscribe_replaces_filters() -> None:
+    router = SubscriptionRouter()
+    router.subscribe("ws", OrderStream(), {"status": ["pending"]})
+    router.subscribe("ws", OrderStream(), {"code": ["123"]})
+
+    assert matched(router, keys(code="999")) == set()
+    assert matched(router, keys(code="123", status="paid")) == {"ws"}
+
+    router.unsubscribe("ws")
+    assert len(router) == 0
+    assert all(not index for index in router.index.values())
+
+
+def test_subscribe_over_websocket() -> None:
+    with TestClient(create_app()) as client:
+        with client.websocket_connect("/order/ws?status=ready") as ws:
+            ws.receive_json()
+            ws.send_json({"action": "subscribe", "filters": {"prod_type": ["drink"]}})
+            assert ws.receive_json() == {"type": "subscribed", "filters": {"prod_type": ["drink"]}}
+            ws.send_json({"action": "subscribe", "filters": {"status": ["eaten"]}})
+            assert ws.receive_json()["type"] == "error"
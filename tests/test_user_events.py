@@ -0,0 +1,43 @@
+import asyncio
+
+import orjson
+import pytest
+
+from app.user_events import UserEventFeed, sse_stream, user_events
+
+
+@pytest.mark.anyio
+async def test_sse_resumes_after_last_event_id() -> None:
+    first = user_events.publish(42, {"type": "status_changed", "order_id": 1, "status": "ready"})
+    user_events.publish(42, {"type": "status_changed", "order_id": 1, "status": "paid"})
+
+    stream = sse_stream(42, first)
+    assert (await anext(stream)).startswith(b"retry: ")
+    chunk = await anext(stream)
+    await stream.aclose()
+
+    event_id, data = chunk.decode().strip().split("\n")
+    assert event_id == f"id: {first + 1}"
+    assert orjson.loads(data.removeprefix("data: "))["status"] == "paid"
+    assert user_events.streams == 0
+
+
+@pytest.mark.anyio
+async def test_wait_wakes_on_publish_and_reports_gaps() -> None:
+    feed = UserEventFeed(history=2, ttl=60, max_users=10)
+    start = feed.last_id
+
+    waiter = asyncio.create_task(feed.wait(1, start, timeout=5))
+    await asyncio.sleep(0)
+    feed.publish(2, {"n": 0})
+    assert not waiter.done()
+    feed.publish(1, {"n": 1})
+    events, truncated = await waiter
+    assert [m for _, m in events] == [{"n": 1}] and not truncated
+    assert feed.waiters == {}
+
+    for n in range(2, 5):
+        feed.publish(1, {"n": n})
+    events, truncated = feed.since(1, start + 2)
+    assert [m for _, m in events] == [{"n": 3}, {"n": 4}]
+    assert truncated
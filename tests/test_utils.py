@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+from httpx import AsyncClient
+import pytest
+
+from app.utils import (
+    HashPoolSaturated,
+    PasswordHashPool,
+    get_password_hash_async,
+    verify_password_async,
+)
+
+
+@pytest.mark.anyio
+async def test_hash_pool_roundtrip() -> None:
+    hashed = await get_password_hash_async("string")
+    assert await verify_password_async("string", hashed)
+    assert not await verify_password_async("wrong", hashed)
+
+
+@pytest.mark.anyio
+async def test_hash_pool_rejects_when_saturated() -> None:
+    pool = PasswordHashPool(max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    running = asyncio.ensure_future(pool.run(release.wait, 5))
+    await asyncio.sleep(0)
+    assert pool.in_flight == 1
+
+    with pytest.raises(HashPoolSaturated):
+        await pool.run(release.wait, 5)
+    assert pool.rejected == 1
+
+    release.set()
+    assert await running is True
+    assert pool.stats()["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_hash_pool_health(async_client: AsyncClient) -> None:
+    rv = await async_client.get("/health/hash-pool")
+    assert rv.status_code == 200
+    assert "queue_depth" in rv.json()
@@ -0,0 +1,132 @@
+import asyncio
+from time import monotonic
+
+from fastapi.testclient import TestClient
+import orjson
+import pytest
+
+from app import ws
+from app.app import create_app
+from app.utils import create_access_token
+from app.ws import ConnectionManager, TokenBucket, ws_connections
+
+
+class FakeSocket:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent: list[dict] = []
+        self.closed: int | None = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_json(self, message):
+        if self.fail:
+            raise RuntimeError("connection lost")
+        self.sent.append(message)
+
+    async def send_text(self, text):
+        await self.send_json(orjson.loads(text))
+
+    async def send_bytes(self, payload):
+        await self.send_json(orjson.loads(payload))
+
+    async def close(self, code=1000, reason=None):
+        self.closed = code
+
+
+def manager(**overrides) -> ConnectionManager:
+    settings = dict(
+        max_connections=10,
+        max_per_user=2,
+        accept_rate=100,
+        accept_burst=100,
+        ping_interval=20,
+        idle_timeout=60,
+    )
+    settings.update(overrides)
+    return ConnectionManager(**settings)
+
+
+@pytest.mark.anyio
+async def test_sweep_pings_and_reaps() -> None:
+    connections = manager()
+    live, idle, dead = FakeSocket(), FakeSocket(), FakeSocket(fail=True)
+    assert await connections.accept(live, principal="user@example.com")
+    assert await connections.accept(idle, principal="user@example.com")
+    assert await connections.accept(dead)
+    connections.connections[idle].last_seen -= 120
+
+    await connections.sweep()
+
+    assert live.sent[-1] == {"type": "ping"} and live.closed is None
+    assert idle.closed == 1001
+    assert dead.closed == 1001
+    assert list(connections.connections) == [live]
+    assert connections.per_user == {"user@example.com": 1}
+
+
+class StalledSocket(FakeSocket):
+    async def send_json(self, message):
+        await asyncio.sleep(3600)
+
+
+@pytest.mark.anyio
+async def test_stalled_sockets_are_pinged_concurrently(monkeypatch) -> None:
+    monkeypatch.setattr(ws, "WS_SEND_TIMEOUT", 0.2)
+    connections = manager()
+    stalled = [StalledSocket() for _ in range(5)]
+    for websocket in stalled:
+        assert await connections.accept(websocket)
+
+    started = monotonic()
+    await connections.sweep()
+
+    # One send timeout for the whole sweep, not one per socket
+    assert monotonic() - started < 0.6
+    assert all(websocket.closed == 1001 for websocket in stalled)
+    assert not connections.connections
+
+
+@pytest.mark.anyio
+async def test_refused_clients_get_jittered_retry() -> None:
+    connections = manager(accept_burst=1, accept_rate=0.5)
+    assert await connections.accept(FakeSocket())
+
+    refused = FakeSocket()
+    assert not await connections.accept(refused)
+    assert refused.closed == 1013
+    hint = refused.sent[0]
+    assert hint["type"] == "retry" and hint["reason"] == "rate_limited"
+    # Not before the bucket has a token again
+    assert hint["retry_after"] >= 1.9
+
+
+def test_token_bucket_refills() -> None:
+    bucket = TokenBucket(rate=1000, burst=1)
+    assert bucket.take() == 0
+    assert 0 < bucket.take() <= 0.001
+
+
+def test_per_user_connection_cap(monkeypatch) -> None:
+    monkeypatch.setattr(ws_connections, "max_per_user", 1)
+    token = create_access_token({"sub": "user@example.com"})
+    other_token = create_access_token({"sub": "other@example.com"})
+    with TestClient(create_app()) as client:
+        with client.websocket_connect(f"/order/ws/updates/7?token={token}") as first:
+            assert first.receive_json()["type"] == "connection_established"
+            # Keyed on the token, not the path
+            with client.websocket_connect(f"/order/ws/updates/8?token={token}") as second:
+                hint = second.receive_json()
+                assert hint["type"] == "retry"
+                assert hint["reason"] == "too_many_user_connections"
+                assert hint["retry_after"] > 0
+            # Other users are unaffected, and anonymous sockets for the same
+            # path can't use up the user's share
+            with client.websocket_connect(
+                "/order/ws/updates/7", headers={"Authorization": f"Bearer {other_token}"}
+            ) as other:
+                assert other.receive_json()["type"] == "connection_established"
+            with client.websocket_connect("/order/ws/updates/7") as anonymous:
+                assert anonymous.receive_json()["type"] == "connection_established"
+    assert ws_connections.per_user == {}